@@ -0,0 +1,188 @@
+import sys
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+
+
+def _estimar_bytes(datos):
+    """Tamaño aproximado de una entrada (serializada a JSON)"""
+    try:
+        return len(json.dumps(datos, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return sys.getsizeof(datos)
+
+
+class CacheLRU:
+    """
+    Cache en memoria acotada, thread-safe, con expiración por entrada (TTL)
+    y desalojo LRU cuando se supera el máximo de entradas o de bytes.
+    Lleva contadores de hits, misses, desalojos y expiraciones.
+    """
+
+    def __init__(self, max_entradas=256, max_bytes=16 * 1024 * 1024, ttl=1800):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._datos = OrderedDict()  # clave -> (expira_en, bytes, datos)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.desalojos = 0
+        self.expiradas = 0
+
+    def _quitar(self, clave):
+        _, tamano, _ = self._datos.pop(clave)
+        self._bytes -= tamano
+
+    def obtener(self, clave):
+        """Devuelve los datos si existen y no expiraron; None en otro caso"""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return None
+            if entrada[0] <= time.time():
+                self._quitar(clave)
+                self.expiradas += 1
+                self.misses += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return entrada[2]
+
+    def guardar(self, clave, datos, ttl=None):
+        """Guarda datos con su TTL (o el TTL por defecto) y aplica los límites"""
+        tamano = _estimar_bytes(datos)
+        if tamano > self.max_bytes:
+            return
+        expira_en = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+            self._datos[clave] = (expira_en, tamano, datos)
+            self._bytes += tamano
+            while len(self._datos) > self.max_entradas or self._bytes > self.max_bytes:
+                clave_antigua = next(iter(self._datos))
+                self._quitar(clave_antigua)
+                self.desalojos += 1
+
+    def tiempo_restante(self, clave):
+        """Segundos de vida que le quedan a una entrada (0 si no existe)"""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            return max(0.0, entrada[0] - time.time()) if entrada else 0.0
+
+    def purgar_expiradas(self):
+        """Elimina las entradas vencidas aunque nadie las haya vuelto a pedir"""
+        ahora = time.time()
+        with self._lock:
+            vencidas = [clave for clave, entrada in self._datos.items() if entrada[0] <= ahora]
+            for clave in vencidas:
+                self._quitar(clave)
+            self.expiradas += len(vencidas)
+        return len(vencidas)
+
+    def eliminar(self, clave):
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._datos)
+
+    def estadisticas(self):
+        """Contadores de uso y tasa de aciertos en porcentaje"""
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "entradas": len(self._datos),
+                "bytes": self._bytes,
+                "max_entradas": self.max_entradas,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "desalojos": self.desalojos,
+                "expiradas": self.expiradas,
+                "hit_rate": round(100 * self.hits / consultas, 1) if consultas else 0.0,
+            }
+
+
+class _LlamadaEnVuelo:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalescing de llamadas concurrentes entre hilos: si varias piden la misma
+    clave a la vez, solo la primera ejecuta la función y las demás esperan
+    y reciben su mismo resultado (o su misma excepción).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_vuelo = {}
+        self.ejecutadas = 0
+        self.coalescidas = 0
+
+    def ejecutar(self, clave, funcion, *args, **kwargs):
+        with self._lock:
+            llamada = self._en_vuelo.get(clave)
+            es_lider = llamada is None
+            if es_lider:
+                llamada = _LlamadaEnVuelo()
+                self._en_vuelo[clave] = llamada
+                self.ejecutadas += 1
+            else:
+                self.coalescidas += 1
+
+        if not es_lider:
+            llamada.evento.wait()
+            if llamada.error is not None:
+                raise llamada.error
+            return llamada.resultado
+
+        try:
+            llamada.resultado = funcion(*args, **kwargs)
+            return llamada.resultado
+        except BaseException as e:
+            llamada.error = e
+            raise
+        finally:
+            with self._lock:
+                self._en_vuelo.pop(clave, None)
+            llamada.evento.set()
+
+
+class SingleFlightAsync:
+    """
+    Coalescing para corutinas dentro de un mismo event loop. Las que llegan
+    mientras otra igual está en curso esperan la misma tarea; cancelar a una
+    de ellas no cancela el trabajo compartido.
+    """
+
+    def __init__(self):
+        self._en_vuelo = {}
+        self.ejecutadas = 0
+        self.coalescidas = 0
+
+    async def ejecutar(self, clave, fabrica_corutina):
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(fabrica_corutina())
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda _: self._en_vuelo.pop(clave, None))
+            self.ejecutadas += 1
+        else:
+            self.coalescidas += 1
+        return await asyncio.shield(tarea)
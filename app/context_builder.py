@@ -0,0 +1,151 @@
+import os
+
+# Presupuesto por defecto del contexto de datos que se manda al LLM
+CONTEXTO_MAX_TOKENS = int(os.getenv("CONTEXTO_MAX_TOKENS", "1200"))
+# Resultados recientes que se detallan por cada equipo en foco
+RECIENTES_POR_EQUIPO = 5
+
+
+def estimar_tokens(texto):
+    """Estimación rápida (~4 caracteres por token), sin depender del tokenizer del modelo"""
+    return (len(texto) + 3) // 4
+
+
+def _fila(fecha, local, visitante, goles_local, goles_visitante):
+    return {"fecha": str(fecha)[:10], "local": local, "visitante": visitante,
+            "gl": goles_local, "gv": goles_visitante}
+
+
+def filas_desde_api(matches):
+    """Partidos de football-data (dicts de la API) -> filas normalizadas"""
+    filas = []
+    for match in matches or []:
+        marcador = (match.get("score") or {}).get("fullTime") or {}
+        filas.append(_fila(match.get("utcDate", ""), match["homeTeam"]["name"], match["awayTeam"]["name"],
+                           marcador.get("home"), marcador.get("away")))
+    return filas
+
+
+def filas_desde_dataframe(df):
+    """DataFrame del dashboard (Fecha, Equipo Local, ..., Goles Visitante) -> filas normalizadas"""
+    columnas = ["Fecha", "Equipo Local", "Equipo Visitante", "Goles Local", "Goles Visitante"]
+    filas = []
+    for fecha, local, visitante, gl, gv in df[columnas].itertuples(index=False, name=None):
+        # pandas deja NaN en los partidos sin marcador
+        filas.append(_fila(fecha, local, visitante, None if gl != gl else gl, None if gv != gv else gv))
+    return filas
+
+
+def agregar_por_equipo(filas):
+    """
+    Agregados por equipo sobre los partidos jugados (con marcador):
+    {equipo: {pj, g, e, p, gf, gc, pts, casa[g,e,p,gf,gc], fuera[...], resultados[(fecha, texto, G/E/P)]}}
+    """
+    equipos = {}
+    for fila in sorted(filas, key=lambda f: f["fecha"]):
+        if fila["gl"] is None or fila["gv"] is None:
+            continue
+        gl, gv = int(fila["gl"]), int(fila["gv"])
+        for equipo, rival, a_favor, en_contra, lado in (
+            (fila["local"], fila["visitante"], gl, gv, "casa"),
+            (fila["visitante"], fila["local"], gv, gl, "fuera"),
+        ):
+            datos = equipos.setdefault(equipo, {
+                "pj": 0, "g": 0, "e": 0, "p": 0, "gf": 0, "gc": 0, "pts": 0,
+                "casa": [0, 0, 0, 0, 0], "fuera": [0, 0, 0, 0, 0], "resultados": [],
+            })
+            resultado = "G" if a_favor > en_contra else "E" if a_favor == en_contra else "P"
+            indice = "gep".index(resultado.lower())
+            datos["pj"] += 1
+            datos[resultado.lower()] += 1
+            datos["gf"] += a_favor
+            datos["gc"] += en_contra
+            datos["pts"] += (3, 1, 0)[indice]
+            datos[lado][indice] += 1
+            datos[lado][3] += a_favor
+            datos[lado][4] += en_contra
+            sitio = "L" if lado == "casa" else "V"
+            datos["resultados"].append((fila["fecha"][5:], f"{a_favor}-{en_contra} vs {rival} ({sitio})", resultado))
+    return equipos
+
+
+def _linea_equipo(nombre, datos):
+    casa, fuera = datos["casa"], datos["fuera"]
+    forma = "".join(r[2] for r in datos["resultados"][-5:])
+    return (f"{nombre}: PJ{datos['pj']} {datos['g']}G-{datos['e']}E-{datos['p']}P "
+            f"GF{datos['gf']} GC{datos['gc']} Pts{datos['pts']} | "
+            f"Casa {casa[0]}-{casa[1]}-{casa[2]} {casa[3]}:{casa[4]} | "
+            f"Fuera {fuera[0]}-{fuera[1]}-{fuera[2]} {fuera[3]}:{fuera[4]} | Forma {forma}")
+
+
+def _lineas_recientes(datos, cantidad):
+    if cantidad <= 0:
+        return []
+    return [f"  {fecha} {texto}" for fecha, texto, _ in datos["resultados"][-cantidad:]]
+
+
+def construir_contexto(filas, equipos_foco=None, max_tokens=CONTEXTO_MAX_TOKENS,
+                       proximos=None, recientes=RECIENTES_POR_EQUIPO, ultimos_partidos=0):
+    """
+    Resume partidos en agregados compactos por equipo para el prompt del LLM,
+    sin pasarse de max_tokens (estimados). Una línea por equipo con PJ, G-E-P,
+    goles, puntos, casa/fuera y forma; los equipos en foco llevan además sus
+    últimos resultados y van primero; el resto se ordena por puntos.
+    proximos: filas de partidos por jugar a listar al final.
+    ultimos_partidos: cuántos resultados más recientes de toda la competición listar.
+
+    Política de recorte cuando no cabe, en este orden:
+      1. se reducen los resultados detallados de los equipos en foco (hasta 0);
+      2. se quitan los últimos resultados de la competición y los próximos
+         partidos que no son de equipos en foco;
+      3. se quitan equipos fuera de foco empezando por los de menos puntos;
+      4. si aun así no cabe, se corta el texto y se indica.
+    """
+    equipos_foco = list(equipos_foco or [])
+    agregados = agregar_por_equipo(filas)
+    en_foco = [e for e in equipos_foco if e in agregados]
+    resto = sorted((e for e in agregados if e not in en_foco),
+                   key=lambda e: (-agregados[e]["pts"], -(agregados[e]["gf"] - agregados[e]["gc"]), e))
+    proximos = list(proximos or [])
+    con_marcador = sorted((f for f in filas if f["gl"] is not None and f["gv"] is not None),
+                          key=lambda f: f["fecha"])
+    jugados = len(con_marcador)
+    ultimos = con_marcador[-ultimos_partidos:] if ultimos_partidos > 0 else []
+
+    def componer(detalle, lista_proximos, otros):
+        lineas = [f"Resumen de {jugados} partidos jugados (PJ G-E-P, goles a favor/en contra, puntos, casa/fuera, forma de más antiguo a más reciente):"]
+        for equipo in en_foco:
+            lineas.append(_linea_equipo(equipo, agregados[equipo]))
+            lineas.extend(_lineas_recientes(agregados[equipo], detalle))
+        for equipo in equipos_foco:
+            if equipo not in agregados:
+                lineas.append(f"{equipo}: sin partidos jugados en el periodo")
+        lineas.extend(_linea_equipo(equipo, agregados[equipo]) for equipo in otros)
+        omitidos = len(resto) - len(otros)
+        if omitidos:
+            lineas.append(f"(+{omitidos} equipos omitidos por espacio)")
+        if ultimos:
+            lineas.append("Últimos resultados:")
+            lineas.extend(f"  {f['fecha'][5:]} {f['local']} {int(f['gl'])}-{int(f['gv'])} {f['visitante']}"
+                          for f in ultimos)
+        if lista_proximos:
+            lineas.append("Próximos partidos:")
+            lineas.extend(f"  {f['fecha'][5:]} {f['local']} - {f['visitante']}" for f in lista_proximos)
+        return "\n".join(lineas)
+
+    detalle = recientes if en_foco else 0
+    otros = list(resto)
+    texto = componer(detalle, proximos, otros)
+    while estimar_tokens(texto) > max_tokens and detalle > 0:
+        detalle -= 1
+        texto = componer(detalle, proximos, otros)
+    if estimar_tokens(texto) > max_tokens:
+        ultimos = []
+        proximos = [f for f in proximos if f["local"] in en_foco or f["visitante"] in en_foco]
+        texto = componer(detalle, proximos, otros)
+    while estimar_tokens(texto) > max_tokens and otros:
+        otros.pop()
+        texto = componer(detalle, proximos, otros)
+    if estimar_tokens(texto) > max_tokens:
+        texto = texto[:max(0, max_tokens * 4 - 20)] + "\n(recortado)"
+    return texto
@@ -0,0 +1,237 @@
+import os
+import time
+import threading
+from datetime import date
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from app import persistent_cache
+
+load_dotenv()
+
+FOOTBALL_API_KEY = os.getenv("FOOTBALL_API_KEY")
+FOOTBALL_API_URL = os.getenv("FOOTBALL_API_URL")
+
+# Plan gratuito de football-data.org: 10 peticiones por minuto
+LIMITE_POR_MINUTO = int(os.getenv("FOOTBALL_API_LIMITE_MINUTO", "10"))
+# Con menos peticiones disponibles que esto se espacian hasta el reset
+UMBRAL_ESPACIADO = int(os.getenv("FOOTBALL_API_UMBRAL_ESPACIADO", "2"))
+MAX_REINTENTOS_429 = 2
+# Vida por defecto de las respuestas en la cache persistente
+CACHE_API_TTL = int(os.getenv("CACHE_API_TTL", "1800"))
+
+# Competiciones disponibles en el plan gratuito (dashboard e histórico local)
+competition_labels = {
+    "WC": "🌍 FIFA World Cup", "CL": "🏆 UEFA Champions League",
+    "BL1": "🇩🇪 Bundesliga", "DED": "🇳🇱 Eredivisie",
+    "BSA": "🇧🇷 Brasileirao Serie A", "PD": "🇪🇸 La Liga",
+    "FL1": "🇫🇷 Ligue 1", "ELC": "🏴 Championship",
+    "PPL": "🇵🇹 Primeira Liga", "EC": "🇪🇺 Euro",
+    "SA": "🇮🇹 Serie A", "PL": "🏴 Premier League"
+}
+
+
+class TokenBucket:
+    """
+    Limitador de tasa tipo token bucket, thread-safe.
+    Se recarga de forma continua a razón de `capacidad` tokens por `periodo`, pero
+    si la API informa su cuota (X-Requests-Available-Minute / X-RequestCounter-Reset)
+    se usa ese valor y la recarga completa ocurre en el reset indicado.
+    Cuando quedan pocos tokens, las peticiones esperan y se espacian en lugar de fallar.
+    """
+
+    def __init__(self, capacidad, periodo=60.0, umbral_espaciado=UMBRAL_ESPACIADO):
+        self.capacidad = capacidad
+        self.periodo = periodo
+        self.umbral_espaciado = umbral_espaciado
+        self.tokens = float(capacidad)
+        self.ultima_recarga = time.monotonic()
+        self.reset_en = None  # momento (monotonic) del reset informado por la API
+        self.ultimo_permiso = 0.0
+        self.condicion = threading.Condition()
+
+    def _recargar(self, ahora):
+        if self.reset_en is not None:
+            # La API manda: no hay recarga gradual hasta su reset
+            if ahora >= self.reset_en:
+                self.tokens = float(self.capacidad)
+                self.reset_en = None
+        else:
+            transcurrido = ahora - self.ultima_recarga
+            self.tokens = min(self.capacidad, self.tokens + transcurrido * self.capacidad / self.periodo)
+        self.ultima_recarga = ahora
+
+    def _espera_necesaria(self, ahora):
+        """Segundos a esperar antes de poder consumir un token (0 si ya se puede)"""
+        if self.tokens < 1:
+            if self.reset_en is not None:
+                return self.reset_en - ahora
+            return (1 - self.tokens) * self.periodo / self.capacidad
+        if self.tokens <= self.umbral_espaciado:
+            # Cuota casi agotada: repartir lo que queda hasta el reset
+            hasta_reset = (self.reset_en - ahora) if self.reset_en is not None else self.periodo
+            intervalo = hasta_reset / (self.tokens + 1)
+            return max(0.0, self.ultimo_permiso + intervalo - ahora)
+        return 0.0
+
+    def adquirir(self):
+        """Bloquea hasta obtener un token. Devuelve los segundos esperados."""
+        inicio = time.monotonic()
+        with self.condicion:
+            while True:
+                ahora = time.monotonic()
+                self._recargar(ahora)
+                espera = self._espera_necesaria(ahora)
+                if espera <= 0:
+                    self.tokens -= 1
+                    self.ultimo_permiso = ahora
+                    return ahora - inicio
+                self.condicion.wait(espera)
+
+    def actualizar_desde_headers(self, disponibles, segundos_reset):
+        """Sincroniza el bucket con la cuota real informada por la API"""
+        with self.condicion:
+            ahora = time.monotonic()
+            self._recargar(ahora)
+            if disponibles is not None:
+                self.tokens = min(self.tokens, float(disponibles))
+            if segundos_reset is not None:
+                self.reset_en = ahora + segundos_reset
+            self.condicion.notify_all()
+
+
+# Estado compartido del cliente
+_sesion = None
+_sesion_lock = threading.Lock()
+limitador = TokenBucket(LIMITE_POR_MINUTO)
+
+_contadores_lock = threading.Lock()
+contadores = {
+    "llamadas": 0,
+    "llamadas_hoy": 0,
+    "dia": date.today().isoformat(),
+    "exitosas": 0,
+    "errores": 0,
+    "respuestas_429": 0,
+    "reintentos": 0,
+    "esperas": 0,
+    "segundos_espera": 0.0,
+    "disponibles_minuto": None,
+    "ultima_exitosa": None,       # time.time() de la última respuesta 200
+    "ultima_latencia_ms": None,   # latencia de la última respuesta recibida
+    "ultimo_429": None,           # time.time() del último 429 recibido
+}
+
+
+def _obtener_sesion():
+    """Session compartida con pool de conexiones y keep-alive"""
+    global _sesion
+    with _sesion_lock:
+        if _sesion is None:
+            _sesion = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=10)
+            _sesion.mount("https://", adaptador)
+            _sesion.mount("http://", adaptador)
+            if FOOTBALL_API_KEY:
+                _sesion.headers.update({"X-Auth-Token": FOOTBALL_API_KEY})
+        return _sesion
+
+
+def url_api(ruta):
+    """Une FOOTBALL_API_URL y la ruta sin duplicar barras"""
+    return f"{(FOOTBALL_API_URL or '').rstrip('/')}/{ruta.lstrip('/')}"
+
+
+def _leer_entero(headers, nombre):
+    try:
+        return int(headers[nombre])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _sumar(**valores):
+    with _contadores_lock:
+        hoy = date.today().isoformat()
+        if contadores["dia"] != hoy:
+            contadores["dia"] = hoy
+            contadores["llamadas_hoy"] = 0
+        for clave, valor in valores.items():
+            contadores[clave] += valor
+
+
+def get(ruta, params=None, timeout=15):
+    """
+    GET a football-data.org pasando por el limitador de tasa.
+    Devuelve el requests.Response; las respuestas 429 se reintentan tras esperar
+    el reset indicado por la API. Lanza requests.RequestException en errores de red.
+    """
+    sesion = _obtener_sesion()
+    for intento in range(MAX_REINTENTOS_429 + 1):
+        espera = limitador.adquirir()
+        if espera > 0.01:
+            print(f"⏳ Cuota de football-data casi agotada, esperé {espera:.1f}s")
+            _sumar(esperas=1, segundos_espera=espera)
+
+        inicio = time.perf_counter()
+        try:
+            response = sesion.get(url_api(ruta), params=params, timeout=timeout)
+        except requests.exceptions.RequestException:
+            _sumar(llamadas=1, llamadas_hoy=1, errores=1)
+            raise
+        _sumar(llamadas=1, llamadas_hoy=1)
+        with _contadores_lock:
+            contadores["ultima_latencia_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+            if response.status_code == 200:
+                contadores["ultima_exitosa"] = time.time()
+
+        disponibles = _leer_entero(response.headers, "X-Requests-Available-Minute")
+        segundos_reset = _leer_entero(response.headers, "X-RequestCounter-Reset")
+        if disponibles is not None:
+            with _contadores_lock:
+                contadores["disponibles_minuto"] = disponibles
+
+        if response.status_code == 429:
+            _sumar(respuestas_429=1)
+            with _contadores_lock:
+                contadores["ultimo_429"] = time.time()
+            limitador.actualizar_desde_headers(0, segundos_reset if segundos_reset is not None else 60)
+            if intento < MAX_REINTENTOS_429:
+                print(f"⚠️ 429 de football-data, reintentando tras el reset ({segundos_reset}s)")
+                _sumar(reintentos=1)
+                continue
+        else:
+            limitador.actualizar_desde_headers(disponibles, segundos_reset)
+
+        _sumar(**({"exitosas": 1} if response.status_code == 200 else {"errores": 1}))
+        return response
+
+
+def obtener_json(ruta, params=None, ttl=CACHE_API_TTL, timeout=15, forzar=False):
+    """
+    Igual que get() pero devuelve (status_code, datos_json) y pasa por la cache
+    persistente compartida con los demás procesos. Solo se guardan respuestas 200.
+    forzar=True ignora la cache y la refresca con la respuesta nueva.
+    """
+    clave = persistent_cache.clave_para(ruta, params)
+    if not forzar:
+        datos = persistent_cache.obtener(clave)
+        if datos is not None:
+            return 200, datos
+
+    response = get(ruta, params=params, timeout=timeout)
+    try:
+        datos = response.json()
+    except ValueError:
+        datos = {"message": response.text}
+    if response.status_code == 200 and ttl > 0:
+        persistent_cache.guardar(clave, datos, ttl)
+    return response.status_code, datos
+
+
+def obtener_contadores():
+    """Copia de los contadores de llamadas a la API"""
+    with _contadores_lock:
+        datos = dict(contadores)
+    datos["segundos_espera"] = round(datos["segundos_espera"], 2)
+    datos["tokens_disponibles"] = round(limitador.tokens, 2)
+    return datos
@@ -0,0 +1,136 @@
+import os
+import time
+import asyncio
+from datetime import datetime
+
+import httpx
+
+from app import football_api
+from app.llm_client import comprobar_llm_async
+from app.logger_service import guardar_json_atomico
+
+RUTA_SYSTEM_STATUS = "logs/system_status.json"
+# Cada cuánto se sondean los servicios y se reescribe system_status.json
+SALUD_INTERVALO = float(os.getenv("SALUD_INTERVALO", "30"))
+SALUD_TIMEOUT = float(os.getenv("SALUD_TIMEOUT", "5"))
+# Ruta barata de football-data para el sondeo (una competición concreta)
+SALUD_RUTA_API = os.getenv("SALUD_RUTA_API", "competitions/PL")
+# football-data solo se sondea tras este tiempo sin tráfico real (la cuota es de 10/min)
+SALUD_API_INACTIVIDAD = float(os.getenv("SALUD_API_INACTIVIDAD", "300"))
+# Con menos peticiones disponibles en el limitador no se sondea: son para los usuarios
+SALUD_API_TOKENS_MIN = float(os.getenv("SALUD_API_TOKENS_MIN", "5"))
+
+_muestra_cpu = None  # (reloj, segundos de CPU del proceso) del sondeo anterior
+_sondeo_api = {"momento": 0.0, "resultado": None}  # último sondeo propio de football-data
+
+
+async def probar_api_futbol():
+    """
+    Estado de football-data sin gastar cuota siempre que se pueda:
+    - con tráfico real en los últimos SALUD_API_INACTIVIDAD segundos se usan los
+      contadores del cliente (última respuesta 200 o último 429);
+    - si no, un GET barato como mucho una vez por SALUD_API_INACTIVIDAD, y solo
+      si al limitador le quedan al menos SALUD_API_TOKENS_MIN peticiones.
+    """
+    if not football_api.FOOTBALL_API_KEY:
+        return {"estado": "sin_configurar", "latencia_ms": None, "origen": None}
+    ahora = time.time()
+    contadores = football_api.obtener_contadores()
+    ultima = contadores.get("ultima_exitosa") or 0
+    ultimo_429 = contadores.get("ultimo_429") or 0
+    if ultimo_429 > ultima and ahora - ultimo_429 < SALUD_API_INACTIVIDAD:
+        # Responde, pero sin cuota este minuto
+        return {"estado": "limitada", "latencia_ms": contadores.get("ultima_latencia_ms"), "origen": "trafico"}
+    if ahora - ultima < SALUD_API_INACTIVIDAD:
+        return {"estado": "online", "latencia_ms": contadores.get("ultima_latencia_ms"), "origen": "trafico"}
+
+    anterior = _sondeo_api["resultado"]
+    if anterior and ahora - _sondeo_api["momento"] < SALUD_API_INACTIVIDAD:
+        return anterior
+    if contadores.get("tokens_disponibles", 0) < SALUD_API_TOKENS_MIN:
+        return {"estado": anterior["estado"] if anterior else "desconocido", "latencia_ms": None, "origen": "omitido"}
+
+    _sondeo_api["momento"] = ahora
+    inicio = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(
+            asyncio.to_thread(football_api.get, SALUD_RUTA_API, None, SALUD_TIMEOUT), SALUD_TIMEOUT + 1
+        )
+    except Exception as e:
+        print(f"🩺 football-data no responde: {e or type(e).__name__}")
+        resultado = {"estado": "offline", "latencia_ms": None, "origen": "sondeo"}
+    else:
+        latencia = round((time.perf_counter() - inicio) * 1000, 1)
+        estado = {200: "online", 429: "limitada"}.get(response.status_code, f"error_{response.status_code}")
+        resultado = {"estado": estado, "latencia_ms": latencia, "origen": "sondeo"}
+    _sondeo_api["resultado"] = resultado
+    return resultado
+
+
+async def probar_llm():
+    """Estado del servidor LLM con un GET a /models"""
+    inicio = time.perf_counter()
+    try:
+        status = await asyncio.wait_for(comprobar_llm_async(SALUD_TIMEOUT), SALUD_TIMEOUT + 1)
+    except (httpx.HTTPError, asyncio.TimeoutError, OSError) as e:
+        print(f"🩺 LLM no responde: {e or type(e).__name__}")
+        return {"estado": "offline", "latencia_ms": None}
+    latencia = round((time.perf_counter() - inicio) * 1000, 1)
+    return {"estado": "online" if status == 200 else f"error_{status}", "latencia_ms": latencia}
+
+
+def uso_cpu():
+    """% de CPU del proceso desde la muestra anterior (None en la primera)"""
+    global _muestra_cpu
+    tiempos = os.times()
+    muestra = (time.monotonic(), tiempos.user + tiempos.system)
+    anterior, _muestra_cpu = _muestra_cpu, muestra
+    if anterior is None or muestra[0] <= anterior[0]:
+        return None
+    return round((muestra[1] - anterior[1]) / (muestra[0] - anterior[0]) * 100, 1)
+
+
+def memoria_mb():
+    """Memoria residente (RSS) del proceso en MB, o None si no se puede medir"""
+    try:
+        with open("/proc/self/statm") as f:
+            paginas = int(f.read().split()[1])
+        return round(paginas * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource  # no existe en Windows
+        # ru_maxrss es el pico (KB en Linux), aproximación cuando no hay /proc
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    except (ImportError, OSError):
+        return None
+
+
+async def publicar_estado(info_cache=None):
+    """Sondea los servicios y escribe RUTA_SYSTEM_STATUS de forma atómica"""
+    api, llm = await asyncio.gather(probar_api_futbol(), probar_llm())
+    estado = {
+        "actualizado": datetime.now().isoformat(timespec="seconds"),
+        "api_football": api["estado"],
+        "llm_local": llm["estado"],
+        "latencias_ms": {"api_football": api["latencia_ms"], "llm_local": llm["latencia_ms"]},
+        "api_football_origen": api["origen"],
+        "cache_entries": info_cache() if info_cache else 0,
+        "cpu_usage": uso_cpu() or 0.0,
+        "memoria_mb": memoria_mb(),
+    }
+    guardar_json_atomico(RUTA_SYSTEM_STATUS, estado)
+    return estado
+
+
+async def bucle_salud(info_cache=None, intervalo=SALUD_INTERVALO):
+    """
+    Tarea de fondo del bot: publica el estado cada `intervalo` segundos.
+    info_cache: función sin argumentos que devuelve el número de entradas en cache.
+    """
+    while True:
+        try:
+            await publicar_estado(info_cache)
+        except Exception as e:
+            print(f"❌ Error publicando estado del sistema: {e}")
+        await asyncio.sleep(intervalo)
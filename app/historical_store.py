@@ -0,0 +1,323 @@
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+
+# Histórico local de partidos: se consulta sin red y se sincroniza de forma
+# incremental contra football-data.org (solo partidos nuevos o modificados).
+RUTA_HISTORICO = os.getenv("HISTORICO_RUTA", "logs/historico_partidos.sqlite")
+# Días hacia adelante que se sincronizan en las temporadas en curso
+HISTORICO_DIAS_FUTURO = int(os.getenv("HISTORICO_DIAS_FUTURO", "30"))
+
+# Estados que ya no cambian: un partido así no se vuelve a pedir
+ESTADOS_FINALES = ("FINISHED", "AWARDED", "CANCELLED")
+
+_local = threading.local()
+
+
+def _conexion():
+    """Una conexión por hilo; crea el esquema e índices la primera vez"""
+    conexion = getattr(_local, "conexion", None)
+    if conexion is None:
+        os.makedirs(os.path.dirname(RUTA_HISTORICO) or ".", exist_ok=True)
+        conexion = sqlite3.connect(RUTA_HISTORICO, timeout=10)
+        conexion.row_factory = sqlite3.Row
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        conexion.executescript("""
+            CREATE TABLE IF NOT EXISTS partidos (
+                id INTEGER PRIMARY KEY,
+                competicion TEXT NOT NULL,
+                temporada INTEGER NOT NULL,
+                fecha TEXT NOT NULL,
+                jornada INTEGER,
+                estado TEXT NOT NULL,
+                local_id INTEGER,
+                local TEXT NOT NULL,
+                visitante_id INTEGER,
+                visitante TEXT NOT NULL,
+                goles_local INTEGER,
+                goles_visitante INTEGER,
+                ultima_actualizacion TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_partidos_comp_fecha ON partidos (competicion, fecha);
+            CREATE INDEX IF NOT EXISTS idx_partidos_comp_temporada ON partidos (competicion, temporada);
+            CREATE INDEX IF NOT EXISTS idx_partidos_local ON partidos (local_id, fecha);
+            CREATE INDEX IF NOT EXISTS idx_partidos_visitante ON partidos (visitante_id, fecha);
+            CREATE INDEX IF NOT EXISTS idx_partidos_estado ON partidos (competicion, temporada, estado);
+            CREATE TABLE IF NOT EXISTS sincronizacion (
+                competicion TEXT NOT NULL,
+                temporada INTEGER NOT NULL,
+                ultima_sync TEXT NOT NULL,
+                ultima_actualizacion TEXT,
+                partidos INTEGER NOT NULL DEFAULT 0,
+                completa INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (competicion, temporada)
+            );
+        """)
+        _local.conexion = conexion
+    return conexion
+
+
+def temporada_actual(hoy=None):
+    """Año de inicio de la temporada europea en curso (julio como corte)"""
+    hoy = hoy or date.today()
+    return hoy.year if hoy.month >= 7 else hoy.year - 1
+
+
+# === SINCRONIZACIÓN ===
+
+def _fila_desde_api(match, competicion, temporada):
+    marcador = (match.get("score") or {}).get("fullTime") or {}
+    return (
+        match["id"], competicion, temporada, match.get("utcDate", ""), match.get("matchday"),
+        match.get("status", ""), match["homeTeam"].get("id"), match["homeTeam"].get("name") or "",
+        match["awayTeam"].get("id"), match["awayTeam"].get("name") or "",
+        marcador.get("home"), marcador.get("away"), match.get("lastUpdated"),
+    )
+
+
+def guardar_partidos(matches, competicion, temporada):
+    """
+    Inserta o actualiza partidos. Un partido existente solo se reescribe si su
+    lastUpdated es más reciente que el guardado. Devuelve (nuevos, actualizados).
+    """
+    conexion = _conexion()
+    antes = conexion.total_changes
+    ids = [m["id"] for m in matches]
+    existentes = set()
+    for i in range(0, len(ids), 500):
+        lote = ids[i:i + 500]
+        existentes.update(fila[0] for fila in conexion.execute(
+            f"SELECT id FROM partidos WHERE id IN ({','.join('?' * len(lote))})", lote
+        ))
+    with conexion:
+        conexion.executemany("""
+            INSERT INTO partidos (id, competicion, temporada, fecha, jornada, estado, local_id, local,
+                                  visitante_id, visitante, goles_local, goles_visitante, ultima_actualizacion)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                fecha = excluded.fecha, jornada = excluded.jornada, estado = excluded.estado,
+                local_id = excluded.local_id, local = excluded.local,
+                visitante_id = excluded.visitante_id, visitante = excluded.visitante,
+                goles_local = excluded.goles_local, goles_visitante = excluded.goles_visitante,
+                ultima_actualizacion = excluded.ultima_actualizacion
+            WHERE excluded.ultima_actualizacion IS NULL
+               OR partidos.ultima_actualizacion IS NULL
+               OR excluded.ultima_actualizacion > partidos.ultima_actualizacion
+        """, [_fila_desde_api(m, competicion, temporada) for m in matches])
+    cambios = conexion.total_changes - antes
+    nuevos = len(set(ids) - existentes)
+    return nuevos, cambios - nuevos
+
+
+def _estado_sync(competicion, temporada):
+    return _conexion().execute(
+        "SELECT * FROM sincronizacion WHERE competicion = ? AND temporada = ?", (competicion, temporada)
+    ).fetchone()
+
+
+def _rango_pendiente(competicion, temporada):
+    """Fechas (desde, hasta) que pueden haber cambiado: desde el partido no final más antiguo"""
+    fila = _conexion().execute(
+        f"SELECT MIN(fecha) FROM partidos WHERE competicion = ? AND temporada = ? "
+        f"AND estado NOT IN ({','.join('?' * len(ESTADOS_FINALES))})",
+        (competicion, temporada, *ESTADOS_FINALES)
+    ).fetchone()
+    if not fila or not fila[0]:
+        return None
+    desde = datetime.fromisoformat(fila[0][:10]).date()
+    hasta = max(desde, date.today()) + timedelta(days=HISTORICO_DIAS_FUTURO)
+    return desde.isoformat(), hasta.isoformat()
+
+
+def sincronizar(competicion, temporada, completa=False):
+    """
+    Sincroniza una competición-temporada:
+    - la primera vez, si aún no hay partidos o con completa=True descarga la temporada entera;
+    - después solo pide el rango desde el partido no terminado más antiguo;
+    - una temporada sin partidos pendientes no vuelve a llamar a la API.
+    Devuelve un dict con lo hecho.
+    """
+    from app import football_api  # solo la sincronización necesita red
+
+    estado = _estado_sync(competicion, temporada)
+    ruta = f"competitions/{competicion}/matches"
+    if estado is None or completa or not estado["partidos"]:
+        params = {"season": temporada}
+    else:
+        rango = _rango_pendiente(competicion, temporada)
+        if rango is None:
+            return {"competicion": competicion, "temporada": temporada, "llamadas": 0,
+                    "nuevos": 0, "actualizados": 0, "detalle": "sin partidos pendientes"}
+        params = {"dateFrom": rango[0], "dateTo": rango[1]}
+
+    status, datos = football_api.obtener_json(ruta, params=params, ttl=0, forzar=True, timeout=30)
+    if status != 200:
+        return {"competicion": competicion, "temporada": temporada, "llamadas": 1,
+                "nuevos": 0, "actualizados": 0, "detalle": f"HTTP {status}: {str(datos)[:120]}"}
+
+    matches = datos.get("matches", [])
+    if "season" not in params:
+        # Un rango de fechas puede cruzar temporadas: guardar solo la pedida
+        matches = [m for m in matches if _temporada_de(m, temporada) == temporada]
+    nuevos, actualizados = guardar_partidos(matches, competicion, temporada)
+
+    conexion = _conexion()
+    total, pendientes, ultima = conexion.execute(
+        f"SELECT COUNT(*), SUM(estado NOT IN ({','.join('?' * len(ESTADOS_FINALES))})), MAX(ultima_actualizacion) "
+        f"FROM partidos WHERE competicion = ? AND temporada = ?",
+        (*ESTADOS_FINALES, competicion, temporada)
+    ).fetchone()
+    with conexion:
+        conexion.execute("""
+            INSERT INTO sincronizacion (competicion, temporada, ultima_sync, ultima_actualizacion, partidos, completa)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(competicion, temporada) DO UPDATE SET
+                ultima_sync = excluded.ultima_sync, ultima_actualizacion = excluded.ultima_actualizacion,
+                partidos = excluded.partidos, completa = excluded.completa
+        """, (competicion, temporada, datetime.now().isoformat(timespec="seconds"), ultima,
+              total, int(total > 0 and not pendientes)))
+    return {"competicion": competicion, "temporada": temporada, "llamadas": 1,
+            "nuevos": nuevos, "actualizados": actualizados, "detalle": f"{total} partidos guardados"}
+
+
+def _temporada_de(match, por_defecto):
+    inicio = (match.get("season") or {}).get("startDate")
+    return int(inicio[:4]) if inicio else por_defecto
+
+
+def sincronizar_todo(competiciones=None, temporadas=None, completa=False):
+    """Sincroniza varias competiciones y temporadas (por defecto todas y la actual)"""
+    from app import football_api
+
+    competiciones = competiciones or list(football_api.competition_labels)
+    temporadas = temporadas or [temporada_actual()]
+    resultados = []
+    for competicion in competiciones:
+        for temporada in temporadas:
+            try:
+                resultado = sincronizar(competicion, temporada, completa=completa)
+            except Exception as e:
+                resultado = {"competicion": competicion, "temporada": temporada, "llamadas": 0,
+                             "nuevos": 0, "actualizados": 0, "detalle": f"error: {e}"}
+            print(f"🗄️ {competicion} {temporada}: +{resultado['nuevos']} nuevos, "
+                  f"{resultado['actualizados']} actualizados ({resultado['detalle']})")
+            resultados.append(resultado)
+    return resultados
+
+
+# === CONSULTAS (sin red) ===
+
+def _match_desde_fila(fila):
+    """Fila de la tabla -> dict con la forma de football-data, para reutilizar el código existente"""
+    return {
+        "id": fila["id"],
+        "utcDate": fila["fecha"],
+        "status": fila["estado"],
+        "matchday": fila["jornada"],
+        "lastUpdated": fila["ultima_actualizacion"],
+        "competition": {"code": fila["competicion"]},
+        "season": {"startDate": f"{fila['temporada']}-07-01"},
+        "homeTeam": {"id": fila["local_id"], "name": fila["local"]},
+        "awayTeam": {"id": fila["visitante_id"], "name": fila["visitante"]},
+        "score": {"fullTime": {"home": fila["goles_local"], "away": fila["goles_visitante"]}},
+    }
+
+
+def consultar_partidos(competicion=None, desde=None, hasta=None, temporada=None,
+                       equipo_ids=None, solo_jugados=False, limite=None, descendente=False):
+    """
+    Partidos guardados localmente, con la misma forma que la API (homeTeam, score...).
+    desde/hasta: fechas (date o 'YYYY-MM-DD'), ambas incluidas.
+    """
+    condiciones, valores = [], []
+    if competicion:
+        condiciones.append("competicion = ?")
+        valores.append(competicion)
+    if temporada is not None:
+        condiciones.append("temporada = ?")
+        valores.append(int(temporada))
+    if desde:
+        condiciones.append("fecha >= ?")
+        valores.append(str(desde)[:10])
+    if hasta:
+        condiciones.append("fecha < ?")
+        valores.append((datetime.fromisoformat(str(hasta)[:10]) + timedelta(days=1)).date().isoformat())
+    if equipo_ids:
+        marcas = ",".join("?" * len(equipo_ids))
+        condiciones.append(f"(local_id IN ({marcas}) OR visitante_id IN ({marcas}))")
+        valores.extend(list(equipo_ids) * 2)
+    if solo_jugados:
+        condiciones.append("goles_local IS NOT NULL AND goles_visitante IS NOT NULL")
+    consulta = "SELECT * FROM partidos"
+    if condiciones:
+        consulta += " WHERE " + " AND ".join(condiciones)
+    consulta += f" ORDER BY fecha {'DESC' if descendente else 'ASC'}, id"
+    if limite:
+        consulta += " LIMIT ?"
+        valores.append(int(limite))
+    try:
+        return [_match_desde_fila(fila) for fila in _conexion().execute(consulta, valores)]
+    except sqlite3.Error as e:
+        print(f"❌ Error consultando el histórico: {e}")
+        return []
+
+
+def estado_sincronizacion():
+    """Filas de la tabla de sincronización (qué hay guardado y cuándo se actualizó)"""
+    try:
+        return [dict(fila) for fila in _conexion().execute(
+            "SELECT * FROM sincronizacion ORDER BY competicion, temporada"
+        )]
+    except sqlite3.Error as e:
+        print(f"❌ Error leyendo el estado del histórico: {e}")
+        return []
+
+
+# === CLI ===
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Histórico local de partidos de football-data.org")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_sync = sub.add_parser("sync", help="Sincroniza (incremental) competiciones y temporadas")
+    p_sync.add_argument("-c", "--competiciones", nargs="*", help="Códigos (por defecto todas)")
+    p_sync.add_argument("-t", "--temporadas", nargs="*", type=int, help="Años de inicio (por defecto la actual)")
+    p_sync.add_argument("--completa", action="store_true", help="Vuelve a descargar las temporadas enteras")
+
+    sub.add_parser("estado", help="Muestra qué hay guardado")
+
+    p_consulta = sub.add_parser("consulta", help="Lista partidos guardados (sin red)")
+    p_consulta.add_argument("-c", "--competicion")
+    p_consulta.add_argument("-t", "--temporada", type=int)
+    p_consulta.add_argument("--desde")
+    p_consulta.add_argument("--hasta")
+    p_consulta.add_argument("-n", "--limite", type=int, default=20)
+    p_consulta.add_argument("--json", action="store_true", help="Salida en JSON")
+
+    args = parser.parse_args(argumentos)
+    if args.comando == "sync":
+        resultados = sincronizar_todo(args.competiciones, args.temporadas, completa=args.completa)
+        print(f"✅ Sincronización terminada: {sum(r['llamadas'] for r in resultados)} llamadas, "
+              f"{sum(r['nuevos'] for r in resultados)} nuevos, {sum(r['actualizados'] for r in resultados)} actualizados")
+    elif args.comando == "estado":
+        for fila in estado_sincronizacion():
+            print(f"🗄️ {fila['competicion']} {fila['temporada']}: {fila['partidos']} partidos, "
+                  f"{'completa' if fila['completa'] else 'en curso'}, última sync {fila['ultima_sync']}")
+    else:
+        partidos = consultar_partidos(args.competicion, args.desde, args.hasta, args.temporada,
+                                      limite=args.limite, descendente=True)
+        if args.json:
+            print(json.dumps(partidos, ensure_ascii=False, indent=2))
+        for match in partidos if not args.json else []:
+            score = match["score"]["fullTime"]
+            print(f"🕒 {match['utcDate'][:10]} [{match['competition']['code']}] "
+                  f"{match['homeTeam']['name']} vs {match['awayTeam']['name']} → {score['home']}:{score['away']}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
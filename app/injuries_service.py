@@ -1,25 +1,22 @@
-import requests
 import os
 from dotenv import load_dotenv
+from app import rapidapi_client
 
 load_dotenv()
 
-headers = {
-    "X-RapidAPI-Key": os.getenv("RAPIDAPI_KEY"),
-    "X-RapidAPI-Host": os.getenv("RAPIDAPI_HOST")
-}
+# Las lesiones cambian a lo largo del día: se guardan unas horas
+LESIONES_TTL = int(float(os.getenv("LESIONES_TTL_HORAS", "6")) * 3600)
 
-def obtener_lesiones(team_id, season=2024):
-    url = f"{os.getenv('RAPIDAPI_URL')}/injuries"
+def obtener_lesiones(team_id, season=2024, forzar=False):
     params = {
         "team": team_id,
         "season": season
     }
 
-    response = requests.get(url, headers=headers, params=params)
+    status_code, datos = rapidapi_client.obtener_json("injuries", params=params, ttl=LESIONES_TTL, forzar=forzar)
 
-    if response.status_code == 200:
-        return response.json().get("response", []), 200
+    if status_code == 200 and not datos.get("errors"):
+        return datos.get("response", []), 200
     else:
-        print("Error API:", response.status_code, response.text)
-        return [], response.status_code
+        print("Error API:", status_code, datos)
+        return [], status_code
@@ -1,24 +1,28 @@
 import os
+import json
+import asyncio
 import requests
+import httpx
 from dotenv import load_dotenv
 
 load_dotenv()
 
 LLM_URL = os.getenv("LLM_API_URL")
 LLM_MODEL = os.getenv("LLM_MODEL")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
 
-def ask_llm(prompt: str, contexto: str = "", temperature=0.7, max_tokens=800):
-    """
-    Función para consultar el modelo LLM local (LM Studio)
-    """
-    
+# Cliente HTTP asíncrono compartido (keep-alive con LM Studio)
+_cliente_async = None
+
+def _construir_payload(prompt, contexto, temperature, max_tokens, stream=False):
+    """Arma el payload OpenAI-compatible para LM Studio"""
     # Crear el prompt completo
     if contexto:
         full_prompt = f"Contexto: {contexto}\n\nPregunta: {prompt}\n\nResponde de forma clara y concisa en español:"
     else:
         full_prompt = f"{prompt}\n\nResponde de forma clara y concisa en español:"
     
-    payload = {
+    return {
         "model": LLM_MODEL,
         "messages": [
             {
@@ -32,9 +36,15 @@ def ask_llm(prompt: str, contexto: str = "", temperature=0.7, max_tokens=800):
         ],
         "temperature": temperature,
         "max_tokens": max_tokens,
-        "stream": False
+        "stream": stream
     }
 
+def ask_llm(prompt: str, contexto: str = "", temperature=0.7, max_tokens=800):
+    """
+    Función para consultar el modelo LLM local (LM Studio)
+    """
+    payload = _construir_payload(prompt, contexto, temperature, max_tokens)
+
     try:
         print(f"🔗 Conectando a LLM: {LLM_URL}")
         print(f"🤖 Modelo: {LLM_MODEL}")
@@ -43,7 +53,7 @@ def ask_llm(prompt: str, contexto: str = "", temperature=0.7, max_tokens=800):
             LLM_URL,
             json=payload,
             headers={"Content-Type": "application/json"},
-            timeout=60
+            timeout=LLM_TIMEOUT
         )
         
         print(f"📡 Status code: {response.status_code}")
@@ -71,8 +81,159 @@ def ask_llm(prompt: str, contexto: str = "", temperature=0.7, max_tokens=800):
         print(f"❌ {error_msg}")
         return f"⚠️ {error_msg}"
 
+# === CLIENTE ASÍNCRONO (para handlers de Telegram) ===
+
+def _obtener_cliente_async():
+    """Devuelve el httpx.AsyncClient compartido, creándolo si hace falta"""
+    global _cliente_async
+    if _cliente_async is None or _cliente_async.is_closed:
+        _cliente_async = httpx.AsyncClient(
+            headers={"Content-Type": "application/json"},
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5)
+        )
+    return _cliente_async
+
+async def cerrar_cliente_async():
+    """Cierra el pool de conexiones del cliente asíncrono"""
+    global _cliente_async
+    if _cliente_async is not None and not _cliente_async.is_closed:
+        await _cliente_async.aclose()
+    _cliente_async = None
+
+def url_modelos():
+    """URL de /models derivada de LLM_URL (…/v1/chat/completions -> …/v1/models)"""
+    base = (LLM_URL or "").rstrip("/")
+    for sufijo in ("/chat/completions", "/completions"):
+        if base.endswith(sufijo):
+            return base[: -len(sufijo)] + "/models"
+    return base + "/models"
+
+async def comprobar_llm_async(timeout=5.0):
+    """GET barato a /models del servidor LLM. Devuelve el status code; lanza httpx.HTTPError si no responde"""
+    response = await _obtener_cliente_async().get(url_modelos(), timeout=timeout)
+    return response.status_code
+
+async def ask_llm_async(prompt: str, contexto: str = "", temperature=0.7, max_tokens=800, deadline=None):
+    """
+    Versión asíncrona de ask_llm: no bloquea el event loop.
+    deadline: segundos máximos para esta petición (por defecto LLM_TIMEOUT).
+    Si la tarea se cancela, la conexión se cierra y la cancelación se propaga.
+    """
+    payload = _construir_payload(prompt, contexto, temperature, max_tokens)
+    limite = deadline or LLM_TIMEOUT
+
+    try:
+        print(f"🔗 Conectando a LLM (async): {LLM_URL}")
+        
+        response = await asyncio.wait_for(
+            _obtener_cliente_async().post(LLM_URL, json=payload),
+            timeout=limite
+        )
+        
+        print(f"📡 Status code: {response.status_code}")
+        
+        if response.status_code == 200:
+            result = response.json()
+            content = result["choices"][0]["message"]["content"]
+            print(f"✅ Respuesta recibida: {len(content)} caracteres")
+            return content
+        else:
+            error_msg = f"Error HTTP {response.status_code}: {response.text}"
+            print(f"❌ {error_msg}")
+            return f"⚠️ Error del servidor LLM: {response.status_code}"
+            
+    except (httpx.ConnectError, httpx.RemoteProtocolError):
+        error_msg = "No se puede conectar al servidor LLM. ¿Está LM Studio ejecutándose?"
+        print(f"❌ {error_msg}")
+        return f"⚠️ {error_msg}"
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        error_msg = f"Timeout al consultar el LLM ({limite}s)"
+        print(f"❌ {error_msg}")
+        return f"⚠️ {error_msg}"
+    except asyncio.CancelledError:
+        print("🛑 Consulta al LLM cancelada")
+        raise
+    except Exception as e:
+        error_msg = f"Error inesperado: {str(e)}"
+        print(f"❌ {error_msg}")
+        return f"⚠️ {error_msg}"
+
+class FragmentoError(str):
+    """Fragmento de stream_llm_async que avisa de un error (la respuesta no terminó bien)"""
+
+
+async def stream_llm_async(prompt: str, contexto: str = "", temperature=0.7, max_tokens=800, deadline=None):
+    """
+    Consulta el LLM en modo streaming (SSE OpenAI-compatible) y va entregando
+    los fragmentos de texto a medida que se generan.
+    Los errores se entregan como un único fragmento "⚠️ ...", igual que ask_llm, pero
+    de tipo FragmentoError para que quien llama sepa que la respuesta quedó incompleta.
+    deadline: segundos máximos para toda la respuesta (por defecto LLM_TIMEOUT).
+    """
+    payload = _construir_payload(prompt, contexto, temperature, max_tokens, stream=True)
+    loop = asyncio.get_running_loop()
+    limite = loop.time() + (deadline or LLM_TIMEOUT)
+    caracteres = 0
+
+    try:
+        print(f"🔗 Conectando a LLM (stream): {LLM_URL}")
+        
+        async with _obtener_cliente_async().stream("POST", LLM_URL, json=payload) as response:
+            print(f"📡 Status code: {response.status_code}")
+            
+            if response.status_code != 200:
+                await response.aread()
+                print(f"❌ Error HTTP {response.status_code}: {response.text}")
+                yield FragmentoError(f"⚠️ Error del servidor LLM: {response.status_code}")
+                return
+            
+            lineas = response.aiter_lines()
+            while True:
+                # El plazo total también vale si el servidor deja de enviar:
+                # cada línea se espera como mucho lo que queda hasta el límite
+                try:
+                    linea = await asyncio.wait_for(anext(lineas), max(0.0, limite - loop.time()))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    print("❌ Timeout durante el streaming del LLM")
+                    yield FragmentoError("\n\n⚠️ Respuesta interrumpida por timeout")
+                    return
+                if not linea.startswith("data:"):
+                    continue
+                datos = linea[5:].strip()
+                if datos == "[DONE]":
+                    break
+                try:
+                    delta = json.loads(datos)["choices"][0].get("delta", {})
+                except (ValueError, KeyError, IndexError):
+                    continue
+                fragmento = delta.get("content")
+                if fragmento:
+                    caracteres += len(fragmento)
+                    yield fragmento
+        
+        print(f"✅ Streaming completado: {caracteres} caracteres")
+            
+    except (httpx.ConnectError, httpx.RemoteProtocolError):
+        error_msg = "No se puede conectar al servidor LLM. ¿Está LM Studio ejecutándose?"
+        print(f"❌ {error_msg}")
+        yield FragmentoError(f"⚠️ {error_msg}")
+    except httpx.TimeoutException:
+        error_msg = "Timeout al consultar el LLM"
+        print(f"❌ {error_msg}")
+        yield FragmentoError(f"⚠️ {error_msg}")
+    except asyncio.CancelledError:
+        print("🛑 Streaming del LLM cancelado")
+        raise
+    except Exception as e:
+        error_msg = f"Error inesperado: {str(e)}"
+        print(f"❌ {error_msg}")
+        yield FragmentoError(f"⚠️ {error_msg}")
+
 # Función de prueba
 if __name__ == "__main__":
     print("🧪 Probando conexión con LLM...")
     respuesta = ask_llm("¿Cómo está el fútbol hoy?")
-    print(f"🤖 Respuesta: {respuesta}")
\ No newline at end of file
+    print(f"🤖 Respuesta: {respuesta}")
@@ -0,0 +1,148 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+
+# Generaciones simultáneas que aguanta LM Studio y solicitudes que pueden esperar turno
+LLM_MAX_CONCURRENCIA = int(os.getenv("LLM_MAX_CONCURRENCIA", "2"))
+LLM_MAX_COLA = int(os.getenv("LLM_MAX_COLA", "20"))
+
+
+class ColaLlenaError(Exception):
+    """La cola del LLM está llena: la solicitud se rechaza en lugar de esperar"""
+
+
+class _Turno:
+    """Una solicitud esperando hueco en el LLM"""
+
+    def __init__(self, chat_id, al_cambiar_posicion):
+        self.chat_id = chat_id
+        self.al_cambiar_posicion = al_cambiar_posicion
+        self.concedido = asyncio.get_running_loop().create_future()
+        self.posicion = None
+        self.encolado_en = time.monotonic()
+
+
+class PlanificadorLLM:
+    """
+    Limita las generaciones simultáneas del LLM y reparte los huecos por turnos
+    entre chats (round-robin): un chat con muchas consultas pendientes no deja
+    sin servicio a los demás. La cola tiene un máximo; si está llena se lanza
+    ColaLlenaError. Cada solicitud en espera puede recibir su posición (#1, #2...)
+    mediante un callback asíncrono cada vez que cambia.
+    Debe usarse desde un único event loop.
+    """
+
+    def __init__(self, max_concurrencia=LLM_MAX_CONCURRENCIA, max_cola=LLM_MAX_COLA):
+        self.max_concurrencia = max(1, max_concurrencia)
+        self.max_cola = max(0, max_cola)
+        self._colas = OrderedDict()  # chat_id -> deque de _Turno, en orden de turno
+        self._en_cola = 0
+        self._activas = 0
+        self._avisos = set()
+        self.atendidas = 0
+        self.encoladas = 0
+        self.rechazadas = 0
+        self._espera_total = 0.0
+
+    async def ejecutar(self, chat_id, fabrica_corutina, al_cambiar_posicion=None):
+        """Espera turno para chat_id, ejecuta fabrica_corutina() y libera el hueco"""
+        await self._adquirir(chat_id, al_cambiar_posicion)
+        try:
+            return await fabrica_corutina()
+        finally:
+            self._liberar()
+
+    async def _adquirir(self, chat_id, al_cambiar_posicion):
+        if self._activas < self.max_concurrencia and not self._en_cola:
+            self._activas += 1
+            self.atendidas += 1
+            return
+        if self._en_cola >= self.max_cola:
+            self.rechazadas += 1
+            raise ColaLlenaError(f"Cola del LLM llena ({self._en_cola} solicitudes en espera)")
+
+        turno = _Turno(chat_id, al_cambiar_posicion)
+        self._colas.setdefault(chat_id, deque()).append(turno)
+        self._en_cola += 1
+        self.encoladas += 1
+        self._avisar_posiciones()
+        try:
+            await turno.concedido
+        except asyncio.CancelledError:
+            if turno.concedido.done() and not turno.concedido.cancelled():
+                # El hueco ya se había concedido: devolverlo
+                self._liberar()
+            else:
+                self._quitar(turno)
+                self._avisar_posiciones()
+            raise
+
+    def _liberar(self):
+        self._activas -= 1
+        while self._colas and self._activas < self.max_concurrencia:
+            # El chat que está primero en la ronda pasa al final tras ser atendido
+            chat_id, cola = self._colas.popitem(last=False)
+            turno = cola.popleft()
+            if cola:
+                self._colas[chat_id] = cola
+            self._en_cola -= 1
+            if turno.concedido.done():
+                continue
+            self._activas += 1
+            self.atendidas += 1
+            self._espera_total += time.monotonic() - turno.encolado_en
+            turno.concedido.set_result(True)
+        self._avisar_posiciones()
+
+    def _quitar(self, turno):
+        cola = self._colas.get(turno.chat_id)
+        if cola and turno in cola:
+            cola.remove(turno)
+            self._en_cola -= 1
+            if not cola:
+                del self._colas[turno.chat_id]
+
+    def _orden_actual(self):
+        """Orden en que se atenderán las solicitudes en espera"""
+        orden = []
+        colas = [list(cola) for cola in self._colas.values()]
+        ronda = 0
+        while len(orden) < self._en_cola:
+            for cola in colas:
+                if ronda < len(cola):
+                    orden.append(cola[ronda])
+            ronda += 1
+        return orden
+
+    def _avisar_posiciones(self):
+        for posicion, turno in enumerate(self._orden_actual(), start=1):
+            if turno.posicion == posicion:
+                continue
+            turno.posicion = posicion
+            if turno.al_cambiar_posicion:
+                aviso = asyncio.ensure_future(self._avisar(turno, posicion))
+                self._avisos.add(aviso)
+                aviso.add_done_callback(self._avisos.discard)
+
+    @staticmethod
+    async def _avisar(turno, posicion):
+        if turno.concedido.done():
+            return  # ya le tocó: no pisar el mensaje con una posición vieja
+        try:
+            await turno.al_cambiar_posicion(posicion)
+        except Exception as e:
+            print(f"⚠️ Error avisando posición en cola: {e}")
+
+    def estadisticas(self):
+        return {
+            "max_concurrencia": self.max_concurrencia,
+            "max_cola": self.max_cola,
+            "activas": self._activas,
+            "en_cola": self._en_cola,
+            "chats_en_cola": len(self._colas),
+            "atendidas": self.atendidas,
+            "encoladas": self.encoladas,
+            "rechazadas": self.rechazadas,
+            "espera_promedio_s": round(self._espera_total / self.encoladas, 2) if self.encoladas else 0.0,
+        }
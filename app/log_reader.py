@@ -0,0 +1,23 @@
+import os
+import pandas as pd
+
+# Lectura del log de interacciones sin efectos secundarios: el dashboard y las
+# páginas de métricas solo leen; crear, rotar y escribir es cosa de logger_service.
+LOG_CSV = "logs/interacciones.csv"
+LOG_CSV_ANTERIOR = "logs/interacciones_anterior.csv"
+
+COLUMNAS = ['timestamp', 'user_id', 'mensaje', 'respuesta', 'liga']
+
+
+def leer_interacciones(log_csv=LOG_CSV, max_registros=None):
+    """
+    Lee las interacciones uniendo el segmento anterior y el actual (en ese orden).
+    log_csv: ruta del segmento actual; el anterior se busca en su misma carpeta.
+    max_registros: si se indica, solo las últimas N.
+    """
+    ruta_anterior = os.path.join(os.path.dirname(log_csv), os.path.basename(LOG_CSV_ANTERIOR))
+    partes = [pd.read_csv(ruta) for ruta in (ruta_anterior, log_csv) if os.path.exists(ruta)]
+    if not partes:
+        return pd.DataFrame(columns=COLUMNAS)
+    df = pd.concat(partes, ignore_index=True)
+    return (df.tail(max_registros) if max_registros else df).reset_index(drop=True)
@@ -1,106 +1,108 @@
 import os
+import csv
 import pandas as pd
 from datetime import datetime
 import threading
+import queue
+import atexit
 import time
 import json
+# Rutas, columnas y lectura compartidas con el dashboard (log_reader no escribe nada)
+from app.log_reader import LOG_CSV, LOG_CSV_ANTERIOR, COLUMNAS, leer_interacciones
 
 # Rutas de logs
-LOG_CSV = "logs/interacciones.csv"
 LOG_JSON = "logs/interacciones.json"
 
+# Rotación por segmentos: al llegar a este número de filas el CSV actual pasa a
+# ser el segmento anterior y se empieza uno nuevo (se conservan 1000-2000 registros)
+MAX_REGISTROS_SEGMENTO = 1000
+
 # Lock para thread safety
 log_lock = threading.Lock()
 
+# Filas en el segmento actual (se cuenta una sola vez al iniciar)
+_registros_segmento = 0
+
 # Asegurar que existe el directorio de logs
 os.makedirs("logs", exist_ok=True)
 
+def _crear_csv_vacio():
+    """Escribe un CSV nuevo solo con headers"""
+    with open(LOG_CSV, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow(COLUMNAS)
+
 def inicializar_csv():
-    """Crea el archivo CSV con headers si no existe o está vacío"""
+    """Crea el archivo CSV con headers si no existe, o valida el header y cuenta filas"""
+    global _registros_segmento
     with log_lock:
         try:
-            if not os.path.exists(LOG_CSV):
-                # Crear archivo con headers
-                df_inicial = pd.DataFrame(columns=[
-                    'timestamp', 'user_id', 'mensaje', 'respuesta', 'liga'
-                ])
-                df_inicial.to_csv(LOG_CSV, index=False)
+            if not os.path.exists(LOG_CSV) or os.path.getsize(LOG_CSV) == 0:
+                _crear_csv_vacio()
+                _registros_segmento = 0
                 print(f"✅ Creado {LOG_CSV} con headers")
                 return
             
-            # Verificar si el archivo está vacío o corrupto
-            file_size = os.path.getsize(LOG_CSV)
-            if file_size == 0:
-                df_inicial = pd.DataFrame(columns=[
-                    'timestamp', 'user_id', 'mensaje', 'respuesta', 'liga'
-                ])
-                df_inicial.to_csv(LOG_CSV, index=False)
-                print(f"✅ Recreado {LOG_CSV} vacío")
+            # Verificar header y contar filas sin cargar el archivo en memoria
+            with open(LOG_CSV, newline="", encoding="utf-8") as f:
+                header = next(csv.reader(f), [])
+                filas = sum(1 for _ in f)
+            
+            if header != COLUMNAS:
+                # Archivo corrupto o con otro formato, recrear
+                _crear_csv_vacio()
+                _registros_segmento = 0
+                print(f"✅ CSV reconstruido por header inválido: {header}")
                 return
             
-            # Intentar leer para verificar integridad
-            try:
-                df_test = pd.read_csv(LOG_CSV)
-                if len(df_test.columns) == 0:
-                    raise pd.errors.EmptyDataError("Sin columnas")
-                print(f"✅ CSV verificado: {len(df_test)} registros")
-            except (pd.errors.EmptyDataError, pd.errors.ParserError):
-                # Archivo corrupto, recrear
-                df_inicial = pd.DataFrame(columns=[
-                    'timestamp', 'user_id', 'mensaje', 'respuesta', 'liga'
-                ])
-                df_inicial.to_csv(LOG_CSV, index=False)
-                print(f"✅ CSV reconstruido por corrupción")
+            _registros_segmento = filas
+            print(f"✅ CSV verificado: {filas} registros")
                 
         except Exception as e:
             print(f"❌ Error inicializando CSV: {e}")
 
+def _rotar_segmento():
+    """Mueve el CSV actual al segmento anterior y empieza uno vacío (llamar con log_lock)"""
+    global _registros_segmento
+    os.replace(LOG_CSV, LOG_CSV_ANTERIOR)
+    _crear_csv_vacio()
+    _registros_segmento = 0
+    print(f"🔄 Log rotado: {LOG_CSV} → {LOG_CSV_ANTERIOR}")
+
+def _limpiar_registro(usuario, mensaje, respuesta, liga=None, timestamp=None):
+    """Normaliza una interacción al formato de fila del CSV"""
+    # Limpiar datos para evitar problemas en CSV
+    return {
+        "timestamp": timestamp or datetime.now().isoformat(),
+        "user_id": str(usuario).replace(',', ';').replace('\n', ' ')[:50],
+        "mensaje": str(mensaje).replace(',', ';').replace('\n', ' ')[:200],
+        "respuesta": str(respuesta).replace(',', ';').replace('\n', ' ')[:500],
+        "liga": str(liga) if liga else ""
+    }
+
 def registrar_interaccion(usuario, mensaje, respuesta, liga=None):
-    """Registra una interacción de forma thread-safe"""
+    """Registra una interacción de forma thread-safe (append de una fila, O(1))"""
+    global _registros_segmento
     try:
-        # Asegurar que el CSV está inicializado
-        inicializar_csv()
-        
-        timestamp = datetime.now().isoformat()
-        
-        # Limpiar datos para evitar problemas en CSV
-        usuario_clean = str(usuario).replace(',', ';').replace('\n', ' ')[:50]
-        mensaje_clean = str(mensaje).replace(',', ';').replace('\n', ' ')[:200]
-        respuesta_clean = str(respuesta).replace(',', ';').replace('\n', ' ')[:500]
-        liga_clean = str(liga) if liga else ""
-        
-        data = {
-            "timestamp": timestamp,
-            "user_id": usuario_clean,
-            "mensaje": mensaje_clean,
-            "respuesta": respuesta_clean,
-            "liga": liga_clean
-        }
+        data = _limpiar_registro(usuario, mensaje, respuesta, liga)
         
         with log_lock:
             try:
-                # Leer CSV existente de forma segura
-                if os.path.exists(LOG_CSV) and os.path.getsize(LOG_CSV) > 0:
-                    df = pd.read_csv(LOG_CSV)
-                else:
-                    df = pd.DataFrame(columns=['timestamp', 'user_id', 'mensaje', 'respuesta', 'liga'])
-                
-                # Agregar nueva fila
-                new_row = pd.DataFrame([data])
-                df = pd.concat([df, new_row], ignore_index=True)
+                if _registros_segmento >= MAX_REGISTROS_SEGMENTO:
+                    _rotar_segmento()
+                elif not os.path.exists(LOG_CSV):
+                    _crear_csv_vacio()
+                    _registros_segmento = 0
                 
-                # Mantener solo los últimos 1000 registros
-                if len(df) > 1000:
-                    df = df.tail(1000)
-                
-                # Guardar CSV
-                df.to_csv(LOG_CSV, index=False)
+                # Agregar nueva fila al final del archivo
+                with open(LOG_CSV, "a", newline="", encoding="utf-8") as f:
+                    csv.DictWriter(f, fieldnames=COLUMNAS).writerow(data)
+                _registros_segmento += 1
                 
                 # También guardar en JSON como backup
                 with open(LOG_JSON, "a", encoding="utf-8") as f:
                     f.write(json.dumps(data, ensure_ascii=False) + "\n")
                 
-                print(f"📝 ✅ Interacción registrada: {usuario_clean} - {mensaje_clean[:30]}...")
+                print(f"📝 ✅ Interacción registrada: {data['user_id']} - {data['mensaje'][:30]}...")
                 
             except Exception as e:
                 print(f"❌ Error guardando en CSV: {e}")
@@ -112,8 +114,147 @@ def registrar_interaccion(usuario, mensaje, respuesta, liga=None):
     except Exception as e:
         print(f"❌ Error crítico en logging: {e}")
 
+def registrar_interacciones_lote(registros):
+    """Escribe un lote de registros ya limpios con una sola apertura de archivo"""
+    global _registros_segmento
+    if not registros:
+        return
+    with log_lock:
+        try:
+            pendientes = list(registros)
+            while pendientes:
+                if _registros_segmento >= MAX_REGISTROS_SEGMENTO:
+                    _rotar_segmento()
+                elif not os.path.exists(LOG_CSV):
+                    _crear_csv_vacio()
+                    _registros_segmento = 0
+                # No pasar del tamaño de segmento dentro de un mismo lote
+                cupo = MAX_REGISTROS_SEGMENTO - _registros_segmento
+                bloque, pendientes = pendientes[:cupo], pendientes[cupo:]
+                with open(LOG_CSV, "a", newline="", encoding="utf-8") as f:
+                    csv.DictWriter(f, fieldnames=COLUMNAS).writerows(bloque)
+                _registros_segmento += len(bloque)
+        except Exception as e:
+            print(f"❌ Error guardando lote en CSV: {e}")
+        
+        # Backup JSON (también como fallback si falló el CSV)
+        try:
+            with open(LOG_JSON, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(data, ensure_ascii=False) + "\n" for data in registros)
+        except Exception as e:
+            print(f"❌ Error guardando lote en JSON: {e}")
+
+# === ESCRITOR EN SEGUNDO PLANO ===
+# Los handlers solo encolan (O(1), sin I/O); un hilo escribe en lotes cuando
+# se junta LOTE_MAX_REGISTROS o pasa LOTE_INTERVALO segundos.
+
+LOTE_MAX_REGISTROS = int(os.getenv("LOG_LOTE_MAX", "50"))
+LOTE_INTERVALO = float(os.getenv("LOG_LOTE_INTERVALO", "2.0"))
+
+_cola_logs = queue.Queue()
+_FIN_COLA = object()
+_hilo_escritor = None
+_hilo_lock = threading.Lock()
+_metricas_cola = {
+    "lotes_escritos": 0,
+    "registros_escritos": 0,
+    "ultimo_lote": 0,
+    "ultima_latencia_ms": 0.0,
+    "max_latencia_ms": 0.0,
+    "total_latencia_ms": 0.0,
+}
+
+def _escribir_lote(lote):
+    """Escribe el lote y actualiza las métricas de latencia"""
+    inicio = time.perf_counter()
+    registrar_interacciones_lote(lote)
+    latencia_ms = (time.perf_counter() - inicio) * 1000
+    _metricas_cola["lotes_escritos"] += 1
+    _metricas_cola["registros_escritos"] += len(lote)
+    _metricas_cola["ultimo_lote"] = len(lote)
+    _metricas_cola["ultima_latencia_ms"] = latencia_ms
+    _metricas_cola["max_latencia_ms"] = max(_metricas_cola["max_latencia_ms"], latencia_ms)
+    _metricas_cola["total_latencia_ms"] += latencia_ms
+
+def _bucle_escritor():
+    """Consume la cola y escribe por tamaño o por tiempo hasta recibir el fin"""
+    lote = []
+    limite = time.monotonic() + LOTE_INTERVALO
+    while True:
+        try:
+            item = _cola_logs.get(timeout=max(0.0, limite - time.monotonic()))
+        except queue.Empty:
+            item = None
+        
+        if item is _FIN_COLA:
+            if lote:
+                _escribir_lote(lote)
+            return
+        if item is not None:
+            lote.append(item)
+        
+        if len(lote) >= LOTE_MAX_REGISTROS or time.monotonic() >= limite:
+            if lote:
+                _escribir_lote(lote)
+                lote = []
+            limite = time.monotonic() + LOTE_INTERVALO
+
+def iniciar_escritor():
+    """Arranca el hilo escritor si no está corriendo"""
+    global _hilo_escritor
+    with _hilo_lock:
+        if _hilo_escritor and _hilo_escritor.is_alive():
+            return
+        _hilo_escritor = threading.Thread(target=_bucle_escritor, name="escritor-logs", daemon=True)
+        _hilo_escritor.start()
+        print(f"🧵 Escritor de logs iniciado (lote={LOTE_MAX_REGISTROS}, intervalo={LOTE_INTERVALO}s)")
+
+def detener_escritor(timeout=10):
+    """Vacía la cola pendiente en disco y detiene el hilo escritor"""
+    global _hilo_escritor
+    with _hilo_lock:
+        if not _hilo_escritor or not _hilo_escritor.is_alive():
+            return
+        _cola_logs.put(_FIN_COLA)
+        _hilo_escritor.join(timeout)
+        _hilo_escritor = None
+    print(f"🧵 Escritor de logs detenido ({_metricas_cola['registros_escritos']} registros escritos)")
+
+def encolar_interaccion(usuario, mensaje, respuesta, liga=None):
+    """Encola una interacción sin bloquear; la escribe el hilo escritor"""
+    try:
+        iniciar_escritor()
+        _cola_logs.put_nowait(_limpiar_registro(usuario, mensaje, respuesta, liga))
+    except Exception as e:
+        print(f"❌ Error encolando interacción: {e}")
+
+def estado_cola():
+    """Profundidad de la cola y latencias de escritura por lote"""
+    lotes = _metricas_cola["lotes_escritos"]
+    return {
+        "en_cola": _cola_logs.qsize(),
+        "lotes_escritos": lotes,
+        "registros_escritos": _metricas_cola["registros_escritos"],
+        "ultimo_lote": _metricas_cola["ultimo_lote"],
+        "ultima_latencia_ms": round(_metricas_cola["ultima_latencia_ms"], 2),
+        "max_latencia_ms": round(_metricas_cola["max_latencia_ms"], 2),
+        "promedio_latencia_ms": round(_metricas_cola["total_latencia_ms"] / lotes, 2) if lotes else 0.0,
+    }
+
+# Garantizar el vaciado de la cola al salir del proceso
+atexit.register(detener_escritor)
+
+def guardar_json_atomico(ruta, datos):
+    """Escribe un JSON en un archivo temporal y lo renombra (los lectores nunca ven un archivo a medias)"""
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    ruta_tmp = f"{ruta}.tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, indent=2)
+    os.replace(ruta_tmp, ruta)
+
 def crear_datos_prueba():
     """Crea datos de prueba para el dashboard"""
+    global _registros_segmento
     print("🔄 Creando datos de prueba...")
     
     # Datos de ejemplo
@@ -177,6 +318,7 @@ def crear_datos_prueba():
     
     with log_lock:
         df.to_csv(LOG_CSV, index=False)
+        _registros_segmento = len(df)
     
     print(f"✅ Creados {len(datos_prueba)} registros de prueba en {LOG_CSV}")
     print("🎉 ¡Ahora puedes ver métricas en el dashboard!")
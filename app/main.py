@@ -1,46 +1,45 @@
 import requests
-from dotenv import load_dotenv
-import os
+from app import football_api
+from app import historical_store
 
-# Cargar variables de entorno
-load_dotenv()
+# Sin credenciales se trabaja solo con el histórico local
+if not football_api.FOOTBALL_API_KEY or not football_api.FOOTBALL_API_URL:
+    print("⚠️ Las variables FOOTBALL_API_KEY o FOOTBALL_API_URL no están definidas: se usará el histórico local.")
 
-# Obtener variables de entorno
-api_key = os.getenv("FOOTBALL_API_KEY")
-url_base = os.getenv("FOOTBALL_API_URL")
-
-# Validar existencia de variables
-if not api_key or not url_base:
-    raise ValueError("⚠️ Las variables FOOTBALL_API_KEY o FOOTBALL_API_URL no están definidas.")
-
-# Construcción de headers
-headers = {
-    "X-Auth-Token": api_key
-}
+def mostrar_partidos(matches):
+    for match in matches:
+        fecha = match["utcDate"][:10]
+        home = match["homeTeam"]["name"]
+        away = match["awayTeam"]["name"]
+        score = match["score"]["fullTime"]
+        print(f"🕒 {fecha} - {home} vs {away} → {score['home']}:{score['away']}")
 
 def obtener_ultimos_partidos(limit=5):
-    """Consulta y muestra los últimos partidos disponibles."""
-    url = f"{url_base}/matches"
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()  # Lanza error si la respuesta no es 2xx
-
-        data = response.json()
-        matches = data.get("matches", [])
-
-        if matches:
-            print("📅 Últimos partidos disponibles:\n")
-            for match in matches[:limit]:
-                fecha = match["utcDate"][:10]
-                home = match["homeTeam"]["name"]
-                away = match["awayTeam"]["name"]
-                score = match["score"]["fullTime"]
-                print(f"🕒 {fecha} - {home} vs {away} → {score['home']}:{score['away']}")
-        else:
-            print("⚠️ No se encontraron partidos en este momento.")
-
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Error al consultar la API: {e}")
+    """Consulta y muestra los últimos partidos disponibles (del histórico local si la API no responde)."""
+    if football_api.FOOTBALL_API_KEY and football_api.FOOTBALL_API_URL:
+        try:
+            response = football_api.get("matches")
+            response.raise_for_status()  # Lanza error si la respuesta no es 2xx
+
+            data = response.json()
+            matches = data.get("matches", [])
+
+            if matches:
+                print("📅 Últimos partidos disponibles:\n")
+                mostrar_partidos(matches[:limit])
+            else:
+                print("⚠️ No se encontraron partidos en este momento.")
+            return
+
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Error al consultar la API: {e}")
+
+    matches = historical_store.consultar_partidos(solo_jugados=True, limite=limit, descendente=True)
+    if matches:
+        print("📦 Últimos partidos del histórico local:\n")
+        mostrar_partidos(matches)
+    else:
+        print("⚠️ El histórico local está vacío (python -m app.historical_store sync).")
 
 # Ejecutar si se corre directamente
 if __name__ == "__main__":
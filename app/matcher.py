@@ -0,0 +1,131 @@
+import re
+import unicodedata
+
+
+def normalizar(texto):
+    """Minúsculas y sin acentos/diacríticos (á→a, ç→c, ñ→n) para comparar texto libre"""
+    descompuesto = unicodedata.normalize("NFKD", str(texto).lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).strip()
+
+
+def _construir_trie(palabras):
+    raiz = {}
+    for palabra in palabras:
+        nodo = raiz
+        for caracter in palabra:
+            nodo = nodo.setdefault(caracter, {})
+        nodo[""] = True
+    return raiz
+
+
+def _trie_a_regex(nodo):
+    """
+    Convierte el trie en una regex con prefijos factorizados: en cada posición del
+    texto el motor recorre el árbol (coste según la longitud del patrón, no según
+    cuántos patrones haya). Las ramas más largas se prueban antes que el final.
+    """
+    alternativas = [re.escape(c) + _trie_a_regex(hijo) for c, hijo in sorted(nodo.items()) if c != ""]
+    if not alternativas:
+        return ""
+    cuerpo = alternativas[0] if len(alternativas) == 1 else "(?:" + "|".join(alternativas) + ")"
+    if "" in nodo:
+        cuerpo = "(?:" + cuerpo + ")?"
+    return cuerpo
+
+
+class MatcherConsultas:
+    """
+    Matcher compilado una sola vez a partir del JSON de configuración.
+    Reconoce en una sola pasada sobre el texto: respuestas personalizadas,
+    equipos (nombre y alias), ligas (etiquetas del teclado), palabras de fútbol
+    y palabras de intención (predicción/análisis). Las coincidencias respetan
+    límites de palabra y no distinguen acentos ni mayúsculas.
+    """
+
+    def __init__(self, respuestas_personalizadas, equipos_ligas, leagues, palabras_futbol, palabras_intencion=()):
+        self.respuestas_personalizadas = respuestas_personalizadas
+        self.equipos_ligas = equipos_ligas
+        self.leagues = leagues
+        # texto normalizado -> [(tipo, valor), ...]
+        self._patrones = {}
+
+        for clave in respuestas_personalizadas:
+            self._agregar(clave, "respuesta", clave)
+        for equipo, datos in equipos_ligas.items():
+            alias = datos.get("alias", [])
+            if isinstance(alias, str):
+                alias = [alias]
+            # El nombre oficial también es patrón: como gana la coincidencia más larga,
+            # "Atlético de Madrid" se reconoce entero y su "madrid" no cuenta como
+            # alias de otro equipo (el Real Madrid)
+            for nombre in [equipo, datos.get("nombre_oficial", equipo)] + list(alias):
+                self._agregar(nombre, "equipo", equipo)
+        for etiqueta in leagues:
+            self._agregar(etiqueta, "liga", etiqueta)
+            # También la etiqueta escrita sin emoji ("premier league")
+            sin_emoji = "".join(c for c in etiqueta if c.isalnum() or c.isspace())
+            self._agregar(sin_emoji, "liga", etiqueta)
+        for palabra in palabras_futbol:
+            self._agregar(palabra, "futbol", palabra)
+        for palabra in palabras_intencion:
+            self._agregar(palabra, "intencion", palabra)
+
+        trie = _construir_trie(self._patrones)
+        self._regex = re.compile(r"(?<!\w)" + _trie_a_regex(trie) + r"(?!\w)") if self._patrones else None
+
+    def _agregar(self, texto, tipo, valor):
+        normalizado = normalizar(texto)
+        if normalizado and (tipo, valor) not in self._patrones.setdefault(normalizado, []):
+            self._patrones[normalizado].append((tipo, valor))
+
+    def _info_equipo(self, equipo):
+        datos = self.equipos_ligas[equipo]
+        return {
+            "detectado": True,
+            "equipo": equipo,
+            "liga": datos.get("liga", ""),
+            "nombre_oficial": datos.get("nombre_oficial", equipo),
+        }
+
+    def analizar(self, texto):
+        """
+        Devuelve en un solo dict todo lo detectado en el texto:
+        respuesta_personalizada (texto o None), equipo (dict como detectar_equipo_y_liga),
+        equipos (todos los mencionados, en orden), liga ({"codigo", "nombre"} o None),
+        intencion (palabras de predicción encontradas) y futbolistica (bool).
+        """
+        normalizado = normalizar(texto)
+        resultado = {
+            "respuesta_personalizada": None,
+            "equipo": {"detectado": False, "equipo": "", "liga": "", "nombre_oficial": ""},
+            "equipos": [],
+            "liga": None,
+            "intencion": [],
+            "futbolistica": False,
+        }
+        # Coincidencia exacta con una respuesta personalizada tiene prioridad
+        for tipo, valor in self._patrones.get(normalizado, []):
+            if tipo == "respuesta":
+                resultado["respuesta_personalizada"] = self.respuestas_personalizadas[valor]
+
+        equipos_vistos = set()
+        for coincidencia in (self._regex.finditer(normalizado) if self._regex else []):
+            for tipo, valor in self._patrones[coincidencia.group(0)]:
+                if tipo == "respuesta" and resultado["respuesta_personalizada"] is None:
+                    resultado["respuesta_personalizada"] = self.respuestas_personalizadas[valor]
+                elif tipo == "equipo" and valor not in equipos_vistos:
+                    equipos_vistos.add(valor)
+                    resultado["equipos"].append(self._info_equipo(valor))
+                elif tipo == "liga" and resultado["liga"] is None:
+                    resultado["liga"] = {"codigo": self.leagues[valor], "nombre": valor}
+                elif tipo == "futbol":
+                    resultado["futbolistica"] = True
+                elif tipo == "intencion":
+                    resultado["intencion"].append(valor)
+
+        if resultado["equipos"]:
+            resultado["equipo"] = resultado["equipos"][0]
+            resultado["futbolistica"] = True
+        if resultado["liga"]:
+            resultado["futbolistica"] = True
+        return resultado
@@ -0,0 +1,74 @@
+import os
+import math
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Muestras que guarda cada histograma (las más recientes)
+METRICAS_VENTANA = int(os.getenv("METRICAS_VENTANA", "500"))
+
+
+class HistogramaMovil:
+    """Últimas N duraciones (ms) de una etapa, con percentiles sobre esa ventana"""
+
+    def __init__(self, tamano=METRICAS_VENTANA):
+        self._muestras = deque(maxlen=tamano)
+        self.total = 0
+
+    def registrar(self, ms):
+        self._muestras.append(ms)
+        self.total += 1
+
+    def resumen(self):
+        muestras = sorted(self._muestras)
+        if not muestras:
+            return {"n": 0, "total": self.total, "promedio_ms": 0.0,
+                    "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+
+        def percentil(p):
+            # Método del rango más cercano
+            indice = max(0, min(len(muestras), math.ceil(p / 100 * len(muestras))) - 1)
+            return round(muestras[indice], 2)
+
+        return {
+            "n": len(muestras),
+            "total": self.total,
+            "promedio_ms": round(sum(muestras) / len(muestras), 2),
+            "p50_ms": percentil(50),
+            "p95_ms": percentil(95),
+            "p99_ms": percentil(99),
+            "max_ms": round(muestras[-1], 2),
+        }
+
+
+_histogramas = {}
+_lock = threading.Lock()
+
+
+def registrar(etapa, ms):
+    """Añade una duración en milisegundos al histograma de la etapa"""
+    with _lock:
+        histograma = _histogramas.get(etapa)
+        if histograma is None:
+            histograma = _histogramas[etapa] = HistogramaMovil()
+        histograma.registrar(ms)
+
+
+@contextmanager
+def medir(etapa):
+    """
+    Mide el bloque y lo registra en la etapa, también si lanza una excepción.
+    Sirve dentro de corutinas (el tiempo incluye los await) y en hilos.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(etapa, (time.perf_counter() - inicio) * 1000)
+
+
+def resumen():
+    """Percentiles de todas las etapas: {etapa: {n, total, promedio_ms, p50_ms, p95_ms, p99_ms, max_ms}}"""
+    with _lock:
+        return {etapa: histograma.resumen() for etapa, histograma in sorted(_histogramas.items())}
@@ -9,9 +9,18 @@ from app.generate_pdf import generar_pdf
 from app.llm_client import ask_llm
 from app.injuries_service import obtener_lesiones  
 from app.teams_service import obtener_equipos
+from app import football_api
+from app import rapidapi_client
+from app import historical_store
+from app.context_builder import construir_contexto, filas_desde_dataframe
+from app.stats_service import tabla_larga, agregados_por_equipo, tabla_posiciones
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import plotly.graph_objects as go
+from app.log_reader import leer_interacciones
 
 # Configuración general
 st.set_page_config(page_title="MCP Fútbol", layout="wide")
@@ -19,19 +28,13 @@ load_dotenv()
 
 api_key = os.getenv("FOOTBALL_API_KEY")
 url_base = os.getenv("FOOTBALL_API_URL")
-headers = {
-    "X-Auth-Token": api_key,
-    "Content-Type": "application/json"
-}
+# Predicciones de la comparación que se recuerdan por sesión (las más recientes)
+MEMO_COMPARACION_MAX = int(os.getenv("MEMO_COMPARACION_MAX", "50"))
+# Predicciones que el dashboard pide a la vez al LLM. Es un límite propio de este
+# proceso: se suma al LLM_MAX_CONCURRENCIA del bot si ambos usan el mismo LM Studio
+DASHBOARD_LLM_CONCURRENCIA = int(os.getenv("DASHBOARD_LLM_CONCURRENCIA", "2"))
 
-competition_labels = {
-    "WC": "🌍 FIFA World Cup", "CL": "🏆 UEFA Champions League",
-    "BL1": "🇩🇪 Bundesliga", "DED": "🇳🇱 Eredivisie",
-    "BSA": "🇧🇷 Brasileirao Serie A", "PD": "🇪🇸 La Liga",
-    "FL1": "🇫🇷 Ligue 1", "ELC": "🏴 Championship",
-    "PPL": "🇵🇹 Primeira Liga", "EC": "🇪🇺 Euro",
-    "SA": "🇮🇹 Serie A", "PL": "🏴 Premier League"
-}
+competition_labels = football_api.competition_labels
 
 # Sidebar
 st.sidebar.title("Filtros")
@@ -39,6 +42,8 @@ selected_label = st.sidebar.selectbox("Competición", list(competition_labels.va
 code_map = {v: k for k, v in competition_labels.items()}
 selected_competition = code_map[selected_label]
 start_date, end_date = st.sidebar.date_input("Rango de fechas", value=(date(2025, 4, 1), date(2025, 5, 22)))
+usar_historico = st.sidebar.toggle("📦 Usar histórico local (sin red)", value=False,
+                                   help="Lee los partidos de la base local (python -m app.historical_store sync)")
 
 # Debug info en sidebar
 with st.sidebar.expander("🔧 Info de Debug"):
@@ -46,39 +51,117 @@ with st.sidebar.expander("🔧 Info de Debug"):
     st.code(f"API Key: {api_key[:10] if api_key else 'NO ENCONTRADA'}...")
     st.code(f"URL Base: {url_base}")
 
+class ErrorAPI(Exception):
+    """Respuesta no 200 de football-data (las excepciones no se guardan en st.cache_data)"""
+    def __init__(self, status_code, data):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.data = data
+
+# Loaders cacheados entre reruns: cada click o selectbox vuelve a ejecutar el script,
+# pero solo se llama a la API si cambia la competición o el rango de fechas.
+# _forzar (no entra en la clave) salta también la cache persistente compartida.
+@st.cache_data(ttl=football_api.CACHE_API_TTL, show_spinner="Cargando partidos...")
+def cargar_partidos(codigo_competencia, fecha_inicio, fecha_fin, _forzar=False):
+    # Rangos ya cerrados no cambian: se pueden cachear mucho más tiempo
+    ttl_partidos = 86400 if fecha_fin < date.today() else football_api.CACHE_API_TTL
+    status_code, data = football_api.obtener_json(
+        f"competitions/{codigo_competencia}/matches",
+        params={"dateFrom": fecha_inicio, "dateTo": fecha_fin},
+        ttl=ttl_partidos, timeout=10, forzar=_forzar
+    )
+    if status_code != 200:
+        raise ErrorAPI(status_code, data)
+    return data
+
+@st.cache_data(ttl=football_api.CACHE_API_TTL, show_spinner=False)
+def cargar_proximos_partidos(codigo_competencia, _forzar=False):
+    status_prox, data_prox = football_api.obtener_json(f"competitions/{codigo_competencia}/matches",
+                                                       params={"status": "SCHEDULED"}, timeout=10,
+                                                       forzar=_forzar)
+    if status_prox != 200:
+        raise ErrorAPI(status_prox, data_prox)
+    return data_prox.get("matches", [])[:10]
+
+# Histórico local (SQLite): sin red, y de respaldo cuando la API falla
+@st.cache_data(ttl=60, show_spinner=False)
+def cargar_partidos_historico(codigo_competencia, fecha_inicio, fecha_fin):
+    return {"matches": historical_store.consultar_partidos(codigo_competencia, fecha_inicio, fecha_fin)}
+
+def proximos_partidos_historico(codigo_competencia):
+    pendientes = historical_store.consultar_partidos(codigo_competencia, desde=date.today(), limite=50)
+    return [m for m in pendientes if m["status"] not in historical_store.ESTADOS_FINALES][:10]
+
+# Tabla larga (equipo x partido) y agregados por equipo, una vez por conjunto de datos
+@st.cache_data(ttl=football_api.CACHE_API_TTL, show_spinner=False)
+def calcular_estadisticas(codigo_competencia, fecha_inicio, fecha_fin, origen, huella, _df_matches):
+    # origen y huella sí entran en la clave: otra fuente u otros datos para las
+    # mismas fechas no deben devolver estadísticas calculadas sobre los anteriores
+    larga = tabla_larga(_df_matches)
+    agregados = agregados_por_equipo(larga)
+    return larga, agregados, tabla_posiciones(agregados)
+
+# Refresco manual: vacía los loaders y en este rerun ignora también la cache persistente
+if st.sidebar.button("🔄 Refrescar datos"):
+    cargar_partidos.clear()
+    cargar_proximos_partidos.clear()
+    cargar_partidos_historico.clear()
+    calcular_estadisticas.clear()
+    st.session_state["forzar_api"] = True
+forzar_api = st.session_state.pop("forzar_api", False)
+
 # API partidos históricos con debug mejorado
-url = f"{url_base}competitions/{selected_competition}/matches?dateFrom={start_date}&dateTo={end_date}"
+ruta_partidos = f"competitions/{selected_competition}/matches"
+url = f"{football_api.url_api(ruta_partidos)}?dateFrom={start_date}&dateTo={end_date}"
 
-try:
-    response = requests.get(url, headers=headers, timeout=10)
-    
-    # Debug en sidebar
-    with st.sidebar.expander("📡 Respuesta API"):
-        st.code(f"Status: {response.status_code}")
-        st.code(f"URL: {url}")
-        if response.status_code != 200:
-            st.code(f"Error: {response.text[:200]}")
-    
-except requests.exceptions.RequestException as e:
-    st.error(f"Error de conexión: {e}")
-    response = None
+origen_datos = "api"
+if usar_historico:
+    data, status_code, origen_datos = cargar_partidos_historico(selected_competition, start_date, end_date), 200, "historico"
+else:
+    try:
+        data = cargar_partidos(selected_competition, start_date, end_date, _forzar=forzar_api)
+        status_code = 200
+    except ErrorAPI as e:
+        status_code, data = e.status_code, e.data
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error de conexión: {e}")
+        status_code, data = None, {}
+
+    # Si la API no responde, se usa lo que haya en el histórico local
+    if status_code != 200:
+        respaldo = cargar_partidos_historico(selected_competition, start_date, end_date)
+        if respaldo["matches"]:
+            st.info(f"📦 La API no respondió ({status_code}); mostrando el histórico local")
+            data, status_code, origen_datos = respaldo, 200, "historico"
+
+# Debug en sidebar
+with st.sidebar.expander("📡 Respuesta API"):
+    st.code(f"Status: {status_code} | Origen: {origen_datos}")
+    st.code(f"URL: {url}")
+    if status_code != 200:
+        st.code(f"Error: {str(data)[:200]}")
+    contadores_api = football_api.obtener_contadores()
+    st.code(f"Llamadas hoy: {contadores_api['llamadas_hoy']} | "
+            f"Disponibles/min: {contadores_api['disponibles_minuto']}")
+    contadores_rapid = rapidapi_client.obtener_contadores()
+    st.code(f"RapidAPI hoy: {contadores_rapid['llamadas_hoy']} | "
+            f"Desde cache: {contadores_rapid['desde_cache']} | "
+            f"Restantes/día: {contadores_rapid['restantes_dia']}")
 
 def obtener_proximos_partidos(codigo_competencia):
-    url_prox = f"{url_base}competitions/{codigo_competencia}/matches?status=SCHEDULED"
+    if origen_datos == "historico":
+        return proximos_partidos_historico(codigo_competencia)
     try:
-        response = requests.get(url_prox, headers=headers, timeout=10)
-        if response.status_code == 200:
-            return response.json().get("matches", [])[:10]
+        return cargar_proximos_partidos(codigo_competencia, _forzar=forzar_api)
     except:
         pass
-    return []
+    return proximos_partidos_historico(codigo_competencia)
 
 matches = []
 df_matches = pd.DataFrame()
 
-if response and response.status_code == 200:
+if status_code == 200:
     try:
-        data = response.json()
         matches = data.get("matches", [])
         
         if matches:
@@ -97,39 +180,50 @@ if response and response.status_code == 200:
     except Exception as e:
         st.error(f"Error procesando respuesta JSON: {e}")
 
-elif response and response.status_code == 400:
+elif status_code == 400:
     st.error("❌ Error 400: Petición incorrecta")
-    try:
-        error_data = response.json()
-        st.code(f"Detalles: {error_data}")
-    except:
-        st.code(f"Respuesta: {response.text}")
+    st.code(f"Detalles: {data}")
     
     st.info("💡 **Posibles soluciones:**")
     st.write("- Intenta cambiar a **Premier League** o **La Liga**")
     st.write("- Verifica que las fechas sean válidas")
     st.write("- La competición seleccionada puede no tener partidos en esas fechas")
     
-elif response and response.status_code == 403:
+elif status_code == 403:
     st.error("❌ Error 403: API Key inválida o sin permisos")
     st.info("Verifica tu API Key en el archivo .env")
     
-elif response and response.status_code == 429:
+elif status_code == 429:
     st.error("❌ Error 429: Límite de requests excedido")
     st.info("Espera un momento antes de hacer otra consulta")
     
 else:
-    st.error(f"❌ Error al consultar la API: {response.status_code if response else 'Sin respuesta'}")
+    st.error(f"❌ Error al consultar la API: {status_code if status_code else 'Sin respuesta'}")
+
+# Filas normalizadas para el contexto compacto del LLM (agregados por equipo con
+# presupuesto de tokens, en lugar de la tabla completa con to_string)
+filas_partidos = filas_desde_dataframe(df_matches) if not df_matches.empty else []
+
+if not df_matches.empty:
+    # Huella barata de los datos: filas, partidos con marcador y última actualización
+    huella_partidos = (
+        len(df_matches),
+        int(df_matches["Goles Local"].notna().sum()),
+        max((m.get("lastUpdated") or "" for m in matches), default=""),
+        df_matches["Fecha"].max(),
+    )
+    df_larga, df_agregados, df_posiciones = calcular_estadisticas(
+        selected_competition, start_date, end_date, origen_datos, huella_partidos, df_matches
+    )
+else:
+    df_larga, df_agregados, df_posiciones = (pd.DataFrame(),) * 3
 
-# ✅ TABS CORREGIDOS - UNA SOLA DECLARACIÓN
-tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
-    "🏟️ Partidos", "📊 Estadísticas globales", "🔍 Por equipo",
-    "🤖 Análisis con LLM", "📥 Exportar", "🔮 Predicción por equipo",
-    "📱 Telegram Metrics"  # NUEVO TAB
-])
+# Cada pestaña es una función y solo se ejecuta la seleccionada (st.tabs ejecutaba
+# las siete en cada rerun). Las que tienen widgets propios son fragmentos: un
+# click dentro de ellas solo vuelve a ejecutar esa pestaña.
 
 # TAB 1 - Partidos
-with tab1:
+def tab_partidos():
     st.title("📅 Partidos")
     if not df_matches.empty:
         st.dataframe(df_matches, use_container_width=True)
@@ -137,7 +231,8 @@ with tab1:
         st.warning("No se encontraron partidos.")
 
 # TAB 2 - Estadísticas globales
-with tab2:
+@st.fragment
+def tab_estadisticas():
     st.title("📊 Estadísticas Globales")
     if not df_matches.empty:
         total_partidos = len(df_matches)
@@ -150,11 +245,10 @@ with tab2:
         col2.metric("Total de Goles", total_goles)
         col3.metric("Empates vs Definidos", f"{empates} 🟰 {ganadores}")
 
-        goal_data = pd.concat([
-            df_matches[["Equipo Local", "Goles Local"]].rename(columns={"Equipo Local": "Equipo", "Goles Local": "Goles"}),
-            df_matches[["Equipo Visitante", "Goles Visitante"]].rename(columns={"Equipo Visitante": "Equipo", "Goles Visitante": "Goles"})
-        ])
-        goal_totals = goal_data.groupby("Equipo")["Goles"].sum().reset_index()
+        goal_totals = df_agregados[["Equipo", "GF"]].rename(columns={"GF": "Goles"})
+
+        st.subheader("🏅 Clasificación del periodo")
+        st.dataframe(df_posiciones, use_container_width=True, hide_index=True)
 
         st.subheader("🥅 Goles por Equipo")
         fig = px.bar(goal_totals.sort_values("Goles"), x="Goles", y="Equipo", orientation="h", text="Goles", height=500)
@@ -172,7 +266,7 @@ with tab2:
                 "Analiza el rendimiento de los equipos según esta tabla de resultados e indica: "
                 "1) los más consistentes, 2) posibles sorpresas y 3) predicciones de desempeño futuro."
             )
-            contexto = df_matches.to_string(index=False)
+            contexto = construir_contexto(filas_partidos, ultimos_partidos=10)
             with st.spinner("🧠 Consultando IA..."):
                 respuesta = ask_llm(prompt, contexto)
             st.markdown("### 📋 Resumen del modelo")
@@ -185,7 +279,8 @@ with tab2:
         st.info("Selecciona una competición con datos disponibles para ver estadísticas")
 
 # TAB 3 - Por equipo
-with tab3:
+@st.fragment
+def tab_por_equipo():
     st.title("🔍 Estadísticas por Equipo")
 
     league_ids = {
@@ -200,18 +295,21 @@ with tab3:
             (df_matches["Equipo Local"] == selected_team) | (df_matches["Equipo Visitante"] == selected_team)
         ]
 
-        goles_anotados = (
-            df_matches.loc[df_matches["Equipo Local"] == selected_team, "Goles Local"].sum() +
-            df_matches.loc[df_matches["Equipo Visitante"] == selected_team, "Goles Visitante"].sum()
-        )
-        goles_recibidos = (
-            df_matches.loc[df_matches["Equipo Local"] == selected_team, "Goles Visitante"].sum() +
-            df_matches.loc[df_matches["Equipo Visitante"] == selected_team, "Goles Local"].sum()
-        )
+        # Agregados ya calculados para todos los equipos (tabla larga + un groupby)
+        agregados_equipo = df_agregados.set_index("Equipo")
+        fila = agregados_equipo.loc[selected_team] if selected_team in agregados_equipo.index else None
 
-        st.metric("Partidos jugados", len(team_matches))
-        st.metric("Goles anotados", goles_anotados)
-        st.metric("Goles recibidos", goles_recibidos)
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Partidos jugados", int(fila["PJ"]) if fila is not None else 0)
+        col2.metric("Goles anotados", int(fila["GF"]) if fila is not None else 0)
+        col3.metric("Goles recibidos", int(fila["GC"]) if fila is not None else 0)
+        col4.metric("Puntos", int(fila["Pts"]) if fila is not None else 0)
+
+        if fila is not None:
+            st.dataframe(pd.DataFrame({
+                condicion: {metrica: int(fila[f"{metrica}_{condicion}"]) for metrica in ("PJ", "G", "E", "P", "GF", "GC", "Pts")}
+                for condicion in ("Local", "Visitante") if f"PJ_{condicion}" in fila.index
+            }).T, use_container_width=True)
 
         st.subheader("📄 Detalle de partidos del equipo")
         st.dataframe(team_matches, use_container_width=True)
@@ -223,11 +321,11 @@ with tab3:
     league_id = league_ids.get(selected_code)
 
     if league_id and selected_team:
-        team_ids, status_equipos = obtener_equipos(league_id)
+        team_ids, status_equipos = obtener_equipos(league_id, forzar=forzar_api)
         if status_equipos == 200 and selected_team in team_ids:
             team_id = team_ids[selected_team]
             st.subheader("🚑 Estado de jugadores")
-            lesiones, status_lesion = obtener_lesiones(team_id)
+            lesiones, status_lesion = obtener_lesiones(team_id, forzar=forzar_api)
             if status_lesion == 200 and lesiones:
                 for lesion in lesiones:
                     jugador = lesion['player']['name']
@@ -243,7 +341,8 @@ with tab3:
             st.info("🔒 Solo se pueden mostrar lesiones para algunas ligas con RapidAPI.")
 
 # TAB 4 - Análisis con LLM
-with tab4:
+@st.fragment
+def tab_analisis_llm():
     st.title("🤖 Análisis con LLM (IA local)")
 
     if not df_matches.empty:
@@ -263,7 +362,7 @@ with tab4:
             pregunta_personalizada = "Según los datos, ¿qué equipo tiene más probabilidad de ganar los próximos partidos?"
 
         if pregunta_personalizada and enviar_pregunta:
-            contexto = df_matches.to_string(index=False)
+            contexto = construir_contexto(filas_partidos, ultimos_partidos=10)
             with st.spinner("🧠 Analizando con IA, por favor espera..."):
                 respuesta = ask_llm(pregunta_personalizada, contexto)
                 st.success("🧠 Respuesta del modelo:")
@@ -276,7 +375,7 @@ with tab4:
         st.warning("No hay datos disponibles para analizar.")
 
 # TAB 5 - Exportar
-with tab5:
+def tab_exportar():
     st.title("📥 Exportar")
     if not df_matches.empty:
         st.download_button("📄 CSV", df_matches.to_csv(index=False), file_name="partidos.csv", mime="text/csv")
@@ -285,7 +384,8 @@ with tab5:
         st.warning("No hay datos para exportar.")
 
 # TAB 6 - Predicción por equipo
-with tab6:
+@st.fragment
+def tab_prediccion():
     st.title("🔮 Predicción por equipo")
     partidos_futuros = obtener_proximos_partidos(selected_competition)
 
@@ -301,19 +401,18 @@ with tab6:
 
             with st.expander(f"{fecha} - {local} vs {visitante}"):
                 if st.button(f"🔍 Generar predicción para {local} vs {visitante}", key=f"{local}_{visitante}_{fecha}"):
-                    contexto = df_matches[
-                        (df_matches["Equipo Local"].isin([local, visitante])) |
-                        (df_matches["Equipo Visitante"].isin([local, visitante]))
-                    ]
+                    hay_historial = any(
+                        {fila["local"], fila["visitante"]} & {local, visitante} for fila in filas_partidos
+                    )
 
-                    if not contexto.empty:
+                    if hay_historial:
                         prompt = (
                             f"Basado en los datos, ¿cuál es tu predicción para el partido entre {local} y {visitante}? "
                             f"Indica fortalezas, debilidades y di: 'El posible ganador es: EQUIPO'."
                         )
 
                         with st.spinner("🔮 Generando predicción con IA..."):
-                            resumen = ask_llm(prompt, contexto.to_string(index=False))
+                            resumen = ask_llm(prompt, construir_contexto(filas_partidos, equipos_foco=[local, visitante]))
 
                         st.markdown("### 📋 Resultado del análisis:")
                         st.markdown(resumen)
@@ -345,24 +444,53 @@ with tab6:
         st.subheader("📊 Comparación de próximos equipos")
         seleccionados = st.multiselect("Selecciona equipos para comparar", sorted(equipos_unicos))
 
-        resumen_comparado = []
+        # Predicciones memorizadas en la sesión por (equipo, rival, huella de los datos):
+        # al añadir un equipo solo se genera el nuevo, y las pendientes van en paralelo
+        # hasta DASHBOARD_LLM_CONCURRENCIA. Se guardan solo las MEMO_COMPARACION_MAX
+        # usadas más recientemente
+        memo = st.session_state.setdefault("predicciones_comparacion", OrderedDict())
+        comparaciones = []
         for equipo in seleccionados:
             encuentros = [m for m in partidos_futuros if equipo in (m["homeTeam"]["name"], m["awayTeam"]["name"])]
             if encuentros:
                 rival = encuentros[0]["awayTeam"]["name"] if equipo == encuentros[0]["homeTeam"]["name"] else encuentros[0]["homeTeam"]["name"]
                 fecha = encuentros[0]["utcDate"][:10]
-                contexto_eq = df_matches[
-                    (df_matches["Equipo Local"] == equipo) | (df_matches["Equipo Visitante"] == equipo)
-                ]
-                with st.spinner(f"🤖 Analizando predicción de {equipo} vs {rival}..."):
-                    pred = ask_llm(f"¿Qué se espera del próximo partido de {equipo} contra {rival}? "
-                                   f"Responde incluyendo 'El posible ganador es:'", contexto_eq.to_string(index=False))
-                resumen_comparado.append({
-                    "Equipo": equipo,
-                    "Oponente": rival,
-                    "Fecha": fecha,
-                    "Predicción": pred
-                })
+                contexto_eq = construir_contexto(filas_partidos, equipos_foco=[equipo, rival])
+                huella = hashlib.sha1(contexto_eq.encode("utf-8")).hexdigest()[:16]
+                comparaciones.append(((equipo, rival, huella), fecha, contexto_eq))
+
+        for clave, _, _ in comparaciones:
+            if clave in memo:
+                memo.move_to_end(clave)
+        pendientes = [(clave, contexto_eq) for clave, _, contexto_eq in comparaciones if clave not in memo]
+        if pendientes:
+            with st.spinner(f"🤖 Analizando {len(pendientes)} predicción(es)..."):
+                with ThreadPoolExecutor(max_workers=min(DASHBOARD_LLM_CONCURRENCIA, len(pendientes))) as ejecutor:
+                    futuros = {
+                        clave: ejecutor.submit(
+                            ask_llm,
+                            f"¿Qué se espera del próximo partido de {clave[0]} contra {clave[1]}? "
+                            f"Responde incluyendo 'El posible ganador es:'",
+                            contexto_eq
+                        )
+                        for clave, contexto_eq in pendientes
+                    }
+                    nuevas = {clave: futuro.result() for clave, futuro in futuros.items()}
+            for clave, pred in nuevas.items():
+                if not pred.startswith("⚠️"):  # los errores se reintentan en la próxima rerun
+                    memo[clave] = pred
+            # Nunca se descartan las que se están mostrando
+            while len(memo) > max(MEMO_COMPARACION_MAX, len(comparaciones)):
+                memo.popitem(last=False)
+        else:
+            nuevas = {}
+
+        resumen_comparado = [{
+            "Equipo": clave[0],
+            "Oponente": clave[1],
+            "Fecha": fecha,
+            "Predicción": memo.get(clave, nuevas.get(clave, ""))
+        } for clave, fecha, _ in comparaciones]
 
         if resumen_comparado:
             df_comparacion = pd.DataFrame(resumen_comparado)
@@ -378,7 +506,8 @@ with tab6:
         st.warning("No hay partidos programados próximamente.")
 
 # TAB 7 - Telegram Metrics
-with tab7:
+@st.fragment
+def tab_telegram_metrics():
     st.title("📱 Métricas del Bot de Telegram")
     
     # Función para cargar datos de Telegram
@@ -397,7 +526,10 @@ with tab7:
         for path in log_paths:
             if os.path.exists(path):
                 try:
-                    datos['interacciones'] = pd.read_csv(path)
+                    interacciones = leer_interacciones(path)
+                    if interacciones.empty:
+                        continue
+                    datos['interacciones'] = interacciones
                     st.success(f"✅ Datos cargados desde: {path}")
                     break
                 except Exception as e:
@@ -611,7 +743,7 @@ with tab7:
             
             with col1:
                 status_api = sistema.get('api_football', 'unknown')
-                color = "🟢" if status_api == "online" else "🔴"
+                color = {"online": "🟢", "limitada": "🟡"}.get(status_api, "🔴")
                 st.metric(f"{color} API Football", status_api.upper())
             
             with col2:
@@ -626,6 +758,19 @@ with tab7:
             with col4:
                 cpu_usage = sistema.get('cpu_usage', 0)
                 st.metric("🔧 CPU Usage", f"{cpu_usage}%")
+
+            latencias = sistema.get('latencias_ms', {})
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                latencia_api = latencias.get('api_football')
+                st.metric("⏱️ Latencia API", f"{latencia_api} ms" if latencia_api is not None else "-")
+            with col2:
+                latencia_llm = latencias.get('llm_local')
+                st.metric("⏱️ Latencia IA", f"{latencia_llm} ms" if latencia_llm is not None else "-")
+            with col3:
+                memoria = sistema.get('memoria_mb')
+                st.metric("🧮 Memoria Bot", f"{memoria} MB" if memoria is not None else "-")
+            st.caption(f"Último sondeo: {sistema.get('actualizado', '-')}")
         
         # ===== MÉTRICAS DE RENDIMIENTO =====
         if 'rendimiento' in datos_telegram:
@@ -647,7 +792,27 @@ with tab7:
                 cache_hit_rate = rendimiento.get('cache_hit_rate', 0)
                 color = "🟢" if cache_hit_rate > 70 else "🟡" if cache_hit_rate > 40 else "🔴"
                 st.metric(f"{color} Cache Hit Rate", f"{cache_hit_rate}%")
-        
+
+            # Percentiles por etapa de handle_message (ventana móvil del bot)
+            etapas = rendimiento.get('etapas', {})
+            if etapas:
+                etapas_df = pd.DataFrame([
+                    {"Etapa": etapa, "Percentil": p.upper(), "ms": valores.get(f"{p}_ms", 0)}
+                    for etapa, valores in etapas.items()
+                    for p in ("p50", "p95", "p99")
+                ])
+                fig_etapas = px.bar(
+                    etapas_df,
+                    x="Etapa",
+                    y="ms",
+                    color="Percentil",
+                    barmode="group",
+                    title="⏱️ Tiempo por Etapa (p50 / p95 / p99)"
+                )
+                st.plotly_chart(fig_etapas, use_container_width=True)
+                st.caption(f"Actualizado: {rendimiento.get('actualizado', '-')} · "
+                           f"muestras de respuesta: {etapas.get('total', {}).get('n', 0)}")
+
         # ===== ANÁLISIS DE MENSAJES =====
         st.header("💬 Análisis de Mensajes")
         
@@ -747,4 +912,19 @@ with tab7:
                 resumen,
                 file_name=f"resumen_telegram_{datetime.now().strftime('%Y%m%d')}.txt",
                 mime="text/plain"
-            )
\ No newline at end of file
+            )
+
+PESTANAS = {
+    "🏟️ Partidos": tab_partidos,
+    "📊 Estadísticas globales": tab_estadisticas,
+    "🔍 Por equipo": tab_por_equipo,
+    "🤖 Análisis con LLM": tab_analisis_llm,
+    "📥 Exportar": tab_exportar,
+    "🔮 Predicción por equipo": tab_prediccion,
+    "📱 Telegram Metrics": tab_telegram_metrics,
+}
+pestana = st.radio("Sección", list(PESTANAS), horizontal=True, key="pestana", label_visibility="collapsed")
+PESTANAS[pestana]()
+
+# Las reruns de un fragmento reutilizan este módulo: que no vuelvan a saltarse la cache
+forzar_api = False
@@ -1,7 +1,7 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 import os
+from app.log_reader import leer_interacciones
 
 
 
@@ -9,17 +9,17 @@ st.set_page_config(page_title="📈 Métricas de Telegram", layout="wide")
 
 st.title("📊 Métricas del Bot de Telegram")
 
-# Ruta del archivo CSV
+# Ruta del archivo CSV (segmento actual; leer_interacciones une también el anterior)
 log_path = "logs/interacciones.csv"
 
 log_path_alt = "app/logs/interacciones.csv"
-if not os.path.exists(log_path) and os.path.exists(log_path_alt):
-    log_path = log_path_alt
+df = leer_interacciones(log_path)
+if df.empty and os.path.exists(log_path_alt):
+    df = leer_interacciones(log_path_alt)
 
-if not os.path.exists(log_path):
+if df.empty:
     st.warning("❌ Aún no se han registrado interacciones con el bot.")
 else:
-    df = pd.read_csv(log_path)
 
     st.subheader("🗂️ Registros de Interacciones")
     st.dataframe(df, use_container_width=True)
@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# Cache en disco compartida entre procesos (bot y dashboard) y entre reinicios.
+# SQLite en modo WAL permite lectores concurrentes mientras otro proceso escribe.
+RUTA_CACHE = os.getenv("CACHE_PERSISTENTE_RUTA", "logs/cache_api.sqlite")
+
+_local = threading.local()
+_contadores_lock = threading.Lock()
+contadores = {"hits": 0, "misses": 0, "escrituras": 0, "errores": 0}
+
+
+def _sumar(clave):
+    with _contadores_lock:
+        contadores[clave] += 1
+
+
+def _conexion():
+    """Una conexión por hilo (sqlite3 no comparte conexiones entre hilos)"""
+    conexion = getattr(_local, "conexion", None)
+    if conexion is None:
+        os.makedirs(os.path.dirname(RUTA_CACHE) or ".", exist_ok=True)
+        conexion = sqlite3.connect(RUTA_CACHE, timeout=5, isolation_level=None)
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        conexion.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " clave TEXT PRIMARY KEY,"
+            " valor TEXT NOT NULL,"
+            " expira_en REAL NOT NULL,"
+            " creado_en REAL NOT NULL)"
+        )
+        conexion.execute("CREATE INDEX IF NOT EXISTS idx_cache_expira ON cache (expira_en)")
+        _local.conexion = conexion
+    return conexion
+
+
+def clave_para(ruta, params=None):
+    """Clave estable a partir del endpoint y sus parámetros (orden independiente)"""
+    params_normalizados = sorted((str(k), str(v)) for k, v in (params or {}).items())
+    return json.dumps([ruta.strip("/"), params_normalizados], ensure_ascii=False)
+
+
+def obtener(clave):
+    """Devuelve los datos guardados si no expiraron; None en otro caso"""
+    try:
+        fila = _conexion().execute(
+            "SELECT valor FROM cache WHERE clave = ? AND expira_en > ?", (clave, time.time())
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"⚠️ Error leyendo cache persistente: {e}")
+        _sumar("errores")
+        return None
+    if fila is None:
+        _sumar("misses")
+        return None
+    _sumar("hits")
+    return json.loads(fila[0])
+
+
+def guardar(clave, datos, ttl):
+    """Guarda (o reemplaza) una entrada con su TTL en segundos"""
+    ahora = time.time()
+    try:
+        _conexion().execute(
+            "INSERT OR REPLACE INTO cache (clave, valor, expira_en, creado_en) VALUES (?, ?, ?, ?)",
+            (clave, json.dumps(datos, ensure_ascii=False), ahora + ttl, ahora)
+        )
+        _sumar("escrituras")
+    except sqlite3.Error as e:
+        print(f"⚠️ Error escribiendo cache persistente: {e}")
+        _sumar("errores")
+
+
+def purgar_expiradas():
+    """Borra las entradas vencidas; devuelve cuántas se eliminaron"""
+    try:
+        return _conexion().execute("DELETE FROM cache WHERE expira_en <= ?", (time.time(),)).rowcount
+    except sqlite3.Error as e:
+        print(f"⚠️ Error purgando cache persistente: {e}")
+        return 0
+
+
+def estadisticas():
+    """Entradas vigentes en disco y contadores de este proceso"""
+    try:
+        entradas = _conexion().execute(
+            "SELECT COUNT(*) FROM cache WHERE expira_en > ?", (time.time(),)
+        ).fetchone()[0]
+    except sqlite3.Error:
+        entradas = None
+    with _contadores_lock:
+        datos = dict(contadores)
+    datos["entradas"] = entradas
+    return datos
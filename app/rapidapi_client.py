@@ -0,0 +1,108 @@
+import os
+import threading
+from datetime import date
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from app import persistent_cache
+
+load_dotenv()
+
+RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY")
+RAPIDAPI_HOST = os.getenv("RAPIDAPI_HOST")
+RAPIDAPI_URL = os.getenv("RAPIDAPI_URL")
+
+_sesion = None
+_sesion_lock = threading.Lock()
+
+_contadores_lock = threading.Lock()
+contadores = {
+    "llamadas": 0,
+    "llamadas_hoy": 0,
+    "dia": date.today().isoformat(),
+    "exitosas": 0,
+    "errores": 0,
+    "desde_cache": 0,
+    "limite_dia": None,       # x-ratelimit-requests-limit
+    "restantes_dia": None,    # x-ratelimit-requests-remaining
+}
+
+
+def _obtener_sesion():
+    """Session compartida con pool de conexiones y las cabeceras de RapidAPI"""
+    global _sesion
+    with _sesion_lock:
+        if _sesion is None:
+            _sesion = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=2, pool_maxsize=4)
+            _sesion.mount("https://", adaptador)
+            _sesion.mount("http://", adaptador)
+            _sesion.headers.update({
+                "X-RapidAPI-Key": RAPIDAPI_KEY or "",
+                "X-RapidAPI-Host": RAPIDAPI_HOST or "",
+            })
+        return _sesion
+
+
+def _leer_entero(headers, nombre):
+    try:
+        return int(headers[nombre])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _sumar(**valores):
+    with _contadores_lock:
+        hoy = date.today().isoformat()
+        if contadores["dia"] != hoy:
+            contadores["dia"] = hoy
+            contadores["llamadas_hoy"] = 0
+        for clave, valor in valores.items():
+            contadores[clave] += valor
+
+
+def obtener_json(ruta, params=None, ttl=3600, timeout=15, forzar=False):
+    """
+    GET a RapidAPI (api-football) que devuelve (status_code, datos_json) pasando por
+    la cache persistente. Solo se guardan respuestas 200 sin "errors": la API
+    responde 200 con errors cuando se agota la cuota diaria.
+    forzar=True ignora la cache y la refresca con la respuesta nueva.
+    """
+    clave = persistent_cache.clave_para(f"rapidapi/{ruta}", params)
+    if not forzar:
+        datos = persistent_cache.obtener(clave)
+        if datos is not None:
+            _sumar(desde_cache=1)
+            return 200, datos
+
+    url = f"{(RAPIDAPI_URL or '').rstrip('/')}/{ruta.lstrip('/')}"
+    try:
+        response = _obtener_sesion().get(url, params=params, timeout=timeout)
+    except requests.exceptions.RequestException:
+        _sumar(llamadas=1, llamadas_hoy=1, errores=1)
+        raise
+    _sumar(llamadas=1, llamadas_hoy=1)
+
+    limite = _leer_entero(response.headers, "x-ratelimit-requests-limit")
+    restantes = _leer_entero(response.headers, "x-ratelimit-requests-remaining")
+    with _contadores_lock:
+        if limite is not None:
+            contadores["limite_dia"] = limite
+        if restantes is not None:
+            contadores["restantes_dia"] = restantes
+
+    try:
+        datos = response.json()
+    except ValueError:
+        datos = {"message": response.text}
+    valida = response.status_code == 200 and not (isinstance(datos, dict) and datos.get("errors"))
+    _sumar(**({"exitosas": 1} if valida else {"errores": 1}))
+    if valida and ttl > 0:
+        persistent_cache.guardar(clave, datos, ttl)
+    return response.status_code, datos
+
+
+def obtener_contadores():
+    """Copia de los contadores de llamadas a RapidAPI"""
+    with _contadores_lock:
+        return dict(contadores)
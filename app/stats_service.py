@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+COLUMNAS_AGREGADOS = ["PJ", "G", "E", "P", "GF", "GC", "DG", "Pts"]
+
+
+def tabla_larga(df_matches):
+    """
+    Partidos del dashboard (una fila por partido) -> una fila por equipo y partido:
+    Fecha, Equipo, Rival, Condicion (Local/Visitante), GF, GC, Resultado (G/E/P), Pts.
+    Solo partidos con marcador. Se calcula una vez por conjunto de datos.
+    """
+    columnas = ["Fecha", "Equipo", "Rival", "Condicion", "GF", "GC"]
+    if df_matches.empty:
+        return pd.DataFrame(columns=columnas + ["Resultado", "Pts"])
+    jugados = df_matches.dropna(subset=["Goles Local", "Goles Visitante"])
+    local = pd.DataFrame({
+        "Fecha": jugados["Fecha"], "Equipo": jugados["Equipo Local"], "Rival": jugados["Equipo Visitante"],
+        "Condicion": "Local", "GF": jugados["Goles Local"], "GC": jugados["Goles Visitante"],
+    })
+    visitante = pd.DataFrame({
+        "Fecha": jugados["Fecha"], "Equipo": jugados["Equipo Visitante"], "Rival": jugados["Equipo Local"],
+        "Condicion": "Visitante", "GF": jugados["Goles Visitante"], "GC": jugados["Goles Local"],
+    })
+    larga = pd.concat([local, visitante], ignore_index=True)
+    larga[["GF", "GC"]] = larga[["GF", "GC"]].astype(int)
+    signo = np.sign(larga["GF"] - larga["GC"])
+    larga["Resultado"] = np.select([signo > 0, signo == 0], ["G", "E"], default="P")
+    larga["Pts"] = np.select([signo > 0, signo == 0], [3, 1], default=0)
+    return larga.sort_values(["Fecha", "Equipo"], ignore_index=True)
+
+
+def agregados_por_equipo(larga):
+    """
+    Todos los agregados por equipo en un solo groupby (Equipo x Condicion):
+    PJ, G, E, P, GF, GC, DG, Pts totales y los mismos con sufijo _Local / _Visitante.
+    """
+    if larga.empty:
+        return pd.DataFrame(columns=["Equipo"] + COLUMNAS_AGREGADOS)
+    parcial = larga.assign(
+        PJ=1,
+        G=(larga["Resultado"] == "G").astype(int),
+        E=(larga["Resultado"] == "E").astype(int),
+        P=(larga["Resultado"] == "P").astype(int),
+        DG=larga["GF"] - larga["GC"],
+    ).groupby(["Equipo", "Condicion"])[COLUMNAS_AGREGADOS].sum()
+
+    por_condicion = parcial.unstack("Condicion", fill_value=0)
+    por_condicion.columns = [f"{metrica}_{condicion}" for metrica, condicion in por_condicion.columns]
+    totales = parcial.groupby(level="Equipo").sum()
+    return totales.join(por_condicion).reset_index()
+
+
+def tabla_posiciones(agregados):
+    """Clasificación: puntos, diferencia de goles y goles a favor"""
+    if agregados.empty:
+        return pd.DataFrame(columns=["Pos", "Equipo"] + COLUMNAS_AGREGADOS)
+    tabla = agregados.sort_values(["Pts", "DG", "GF", "Equipo"], ascending=[False, False, False, True])
+    tabla = tabla[["Equipo"] + COLUMNAS_AGREGADOS].reset_index(drop=True)
+    tabla.insert(0, "Pos", range(1, len(tabla) + 1))
+    return tabla
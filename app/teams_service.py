@@ -1,27 +1,23 @@
-import requests
 import os
 from dotenv import load_dotenv
+from app import rapidapi_client
 
 load_dotenv()
 
-headers = {
-    "X-RapidAPI-Key": os.getenv("RAPIDAPI_KEY"),
-    "X-RapidAPI-Host": os.getenv("RAPIDAPI_HOST")
-}
+# Los equipos de una liga-temporada casi no cambian: se guardan días
+EQUIPOS_TTL = int(float(os.getenv("EQUIPOS_TTL_DIAS", "7")) * 86400)
 
-def obtener_equipos(league_id, season=2024):
-    url = f"{os.getenv('RAPIDAPI_URL')}/teams"
+def obtener_equipos(league_id, season=2024, forzar=False):
     params = {
         "league": league_id,
         "season": season
     }
 
-    response = requests.get(url, headers=headers, params=params)
+    status_code, datos = rapidapi_client.obtener_json("teams", params=params, ttl=EQUIPOS_TTL, forzar=forzar)
 
-    if response.status_code == 200:
-        equipos = response.json().get("response", [])
+    if status_code == 200 and not datos.get("errors"):
+        equipos = datos.get("response", [])
         return {team["team"]["name"]: team["team"]["id"] for team in equipos}, 200
     else:
-        print("Error API:", response.status_code, response.text)
-        return {}, response.status_code
-
+        print("Error API:", status_code, datos)
+        return {}, status_code
@@ -1,15 +1,20 @@
 import os
-import requests
 import logging
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes,
     filters, CallbackContext, CallbackQueryHandler
 )
 import json
 import time
+import asyncio
+import hashlib
+import re
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 # === CARGA DE CONFIGURACIÓN DESDE JSON CENTRALIZADO ===
 RUTA_JSON = os.path.join(os.path.dirname(__file__), "data", "mcp_futbol_data.json")
@@ -34,6 +39,9 @@ prompts = config.get("prompts", {})
 teclado_principal = config.get("teclado_principal", [])
 ayuda_mensaje = config.get("ayuda_mensaje", {})
 
+# Palabras que piden análisis/predicción de IA en consultas de equipo
+PALABRAS_PREDICCION = ["prediccion", "analisis", "opinion", "quien", "ganara", "probabilidad"]
+
 # Ya puedes usarlas aquí
 print(f"🎯 Respuestas personalizadas: {len(respuestas_personalizadas)}")
 print("📝 Keys principales:", list(config.keys()))
@@ -57,39 +65,111 @@ except Exception as e:
 # === CARGA DE LLAMADAS EXTERNAS (IA, LOGGING) ===
 print("🔧 Cargando dependencias...")
 try:
-    from app.llm_client import ask_llm
+    from app.llm_client import ask_llm_async, stream_llm_async, cerrar_cliente_async, FragmentoError
     print("✅ llm_client importado correctamente")
 except Exception as e:
     print(f"❌ Error importando llm_client: {e}")
 
 try:
-    from app.logger_service import registrar_interaccion
+    from app.logger_service import encolar_interaccion, detener_escritor, estado_cola, guardar_json_atomico
     print("✅ logger_service importado correctamente")
 except Exception as e:
     print(f"❌ Error importando logger_service: {e}")
-    def registrar_interaccion(usuario, mensaje, respuesta, liga=None):
+    def encolar_interaccion(usuario, mensaje, respuesta, liga=None):
         print(f"📝 Log: {usuario} - {mensaje[:50]}...")
+    def detener_escritor(timeout=10):
+        pass
+    def estado_cola():
+        return {}
+    def guardar_json_atomico(ruta, datos):
+        pass
+
+from app import football_api
+from app.cache_service import CacheLRU, SingleFlight, SingleFlightAsync
+from app.matcher import MatcherConsultas, normalizar
+from app.llm_scheduler import PlanificadorLLM, ColaLlenaError
+from app.metrics_service import medir
+from app.context_builder import construir_contexto, filas_desde_api
+from app import metrics_service
+from app import health_service
+from app import persistent_cache
+from app import historical_store
 
 # === ENV Y CONFIG EXTERNA ===
 load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 FOOTBALL_API_KEY = os.getenv("FOOTBALL_API_KEY")
-FOOTBALL_API_URL = os.getenv("FOOTBALL_API_URL")
 
-headers = {"X-Auth-Token": FOOTBALL_API_KEY} if FOOTBALL_API_KEY else {}
-
-cache_datos = {}
 CACHE_DURACION = 1800  # 30 minutos
 
+# Ventana de partidos que se descarga por competición (una sola llamada)
+VENTANA_PASADO_DIAS = int(os.getenv("VENTANA_PASADO_DIAS", "60"))
+VENTANA_FUTURO_DIAS = int(os.getenv("VENTANA_FUTURO_DIAS", "60"))
+ESTADOS_PROGRAMADOS = {"SCHEDULED", "TIMED"}
+# Vida en cache de una ventana leída del histórico local cuando la API falla
+HISTORICO_RESPALDO_TTL = int(os.getenv("HISTORICO_RESPALDO_TTL", "300"))
+# Tiempo máximo de cada consulta de datos cuando se hacen en paralelo
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "12"))
+# Hilos para esas consultas: acotados para que los timeouts no los acumulen
+FETCH_MAX_HILOS = int(os.getenv("FETCH_MAX_HILOS", "8"))
+# Equipos de una misma consulta que se buscan a la vez ("Bayern vs Dortmund")
+MAX_EQUIPOS_CONSULTA = 2
+CACHE_MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", "200"))
+CACHE_MAX_MB = float(os.getenv("CACHE_MAX_MB", "32"))
+
+cache_datos = CacheLRU(
+    max_entradas=CACHE_MAX_ENTRADAS,
+    max_bytes=int(CACHE_MAX_MB * 1024 * 1024),
+    ttl=CACHE_DURACION
+)
+
+# Respuestas del LLM ya generadas (por plantilla + parámetros + datos)
+cache_llm = CacheLRU(
+    max_entradas=int(os.getenv("LLM_CACHE_MAX_ENTRADAS", "100")),
+    max_bytes=4 * 1024 * 1024,
+    ttl=CACHE_DURACION
+)
+ENFOQUE_PREDICCION = "Responde la consulta con una predicción fundamentada en la forma reciente y los próximos rivales"
+
+# id de equipo en la API -> clave en equipos_ligas (se resuelve una vez por equipo)
+indice_equipos = {}
+
+# Peticiones idénticas simultáneas comparten una sola descarga / generación
+vuelos_datos = SingleFlight()
+vuelos_llm = SingleFlightAsync()
+# Modo de recepción de updates: "polling" (por defecto) o "webhook"
+BOT_MODO = os.getenv("BOT_MODO", "polling").strip().lower()
+# Webhook: URL pública base (la que ve Telegram), dirección local y secreto compartido
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram").strip("/")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+# Updates de Telegram atendidos a la vez (los de un mismo chat siguen en orden)
+TELEGRAM_CONCURRENCIA = int(os.getenv("TELEGRAM_CONCURRENCIA", "8"))
+# Updates que PTB puede tener en vuelo: los que esperan el turno de su chat no
+# deben ocupar los huecos de TELEGRAM_CONCURRENCIA (ver en_orden_por_chat)
+TELEGRAM_UPDATES_EN_VUELO = int(os.getenv("TELEGRAM_UPDATES_EN_VUELO", "1024"))
+
+# Huecos del LLM repartidos por turnos entre chats (LLM_MAX_CONCURRENCIA / LLM_MAX_COLA)
+planificador_llm = PlanificadorLLM()
+
+# Métricas que lee el dashboard (pestaña Telegram Metrics)
+RUTA_PERFORMANCE = "logs/performance.json"
+METRICAS_INTERVALO = int(os.getenv("METRICAS_INTERVALO", "60"))
+
+# Streaming de respuestas del LLM con ediciones progresivas del mensaje
+LLM_STREAMING = os.getenv("LLM_STREAMING", "1") == "1"
+EDICION_INTERVALO = float(os.getenv("TELEGRAM_EDICION_INTERVALO", "1.5"))  # Telegram admite ~1 edición/s por chat
+LIMITE_MENSAJE_TELEGRAM = 4096
+
 def obtener_cache(clave):
-    if clave in cache_datos:
-        timestamp, datos = cache_datos[clave]
-        if time.time() - timestamp < CACHE_DURACION:
-            return datos
-    return None
+    with medir("cache"):
+        return cache_datos.obtener(clave)
 
-def guardar_cache(clave, datos):
-    cache_datos[clave] = (time.time(), datos)
+def guardar_cache(clave, datos, ttl=None):
+    cache_datos.guardar(clave, datos, ttl)
 
 # === FUNCIONES GENERALES (Prompts y Respuestas desde JSON) ===
 
@@ -98,9 +178,28 @@ def crear_prompt(tipo, **kwargs):
     plantilla = prompts.get(tipo)
     if not plantilla:
         return f"Consulta sobre fútbol: {kwargs.get('user_input','')}"
+    kwargs.setdefault("fecha_actual", datetime.now().strftime("%d/%m/%Y"))
     return plantilla.format(**kwargs)
 
-def revisar_respuesta_llm(consulta_usuario, respuesta_bot):
+def clave_respuesta_llm(tipo, parametros, datos=None):
+    """
+    Clave de cache de una respuesta del LLM: plantilla + parámetros normalizados
+    (sin acentos, mayúsculas ni signos) + huella SHA-1 de los datos de contexto.
+    """
+    # "¿Quién ganará?" y "quien ganara" deben dar la misma clave
+    normalizados = sorted(
+        (clave, " ".join(re.findall(r"\w+", normalizar(valor)))) for clave, valor in parametros.items()
+    )
+    huella = hashlib.sha1(
+        json.dumps(datos or {}, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    ).hexdigest()
+    return f"llm|{tipo}|{json.dumps(normalizados, ensure_ascii=False)}|{huella}"
+
+def frescura_ventana(liga_codigo):
+    """Segundos que le quedan a los datos de la liga: una respuesta basada en ellos no debe durar más"""
+    return cache_datos.tiempo_restante(f"ventana_{liga_codigo}")
+
+async def revisar_respuesta_llm(consulta_usuario, respuesta_bot):
     """
     Llama al LLM usando el prompt 'revisor' definido en el JSON para auditar la respuesta generada.
     Devuelve el texto del veredicto y sugerencia si aplica.
@@ -109,100 +208,170 @@ def revisar_respuesta_llm(consulta_usuario, respuesta_bot):
         consulta_usuario=consulta_usuario,
         respuesta_bot=respuesta_bot
     )
-    resultado_revision = ask_llm(prompt_revisor)
+    resultado_revision = await ask_llm_async(prompt_revisor)
     return resultado_revision
 
 
+# Matcher compilado una sola vez con equipos, alias, ligas y palabras clave del JSON
+matcher = MatcherConsultas(
+    respuestas_personalizadas, equipos_ligas, leagues, palabras_futbol, PALABRAS_PREDICCION
+)
+
 def buscar_respuesta_personalizada(texto):
-    texto_lower = texto.lower().strip()
-    # Coincidencia exacta
-    if texto_lower in respuestas_personalizadas:
-        return respuestas_personalizadas[texto_lower]
-    # Buscar palabras clave dentro del texto
-    for clave, respuesta in respuestas_personalizadas.items():
-        if clave in texto_lower:
-            return respuesta
-    return None
+    return matcher.analizar(texto)["respuesta_personalizada"]
 
 def es_consulta_futbolistica(texto):
-    texto_lower = texto.lower().strip()
-    return any(palabra in texto_lower for palabra in palabras_futbol)
+    return matcher.analizar(texto)["futbolistica"]
 
 def detectar_equipo_y_liga(texto):
-    texto_lower = texto.lower()
-    for equipo, datos in equipos_ligas.items():
-        # Busca coincidencia exacta o alias del equipo
-        alias = datos.get("alias", [])
-        if isinstance(alias, str):
-            alias = [alias]
-        nombres_posibles = [equipo.lower()] + [a.lower() for a in alias]
-        if any(nombre in texto_lower for nombre in nombres_posibles):
-            liga = datos.get("liga", "")
-            nombre_oficial = datos.get("nombre_oficial", equipo)
-            return {
-                "detectado": True,
-                "equipo": equipo,
-                "liga": liga,
-                "nombre_oficial": nombre_oficial,
-            }
-    return {"detectado": False, "equipo": "", "liga": "", "nombre_oficial": ""}
+    return matcher.analizar(texto)["equipo"]
 
 
 
 # === FUNCIONES DE API Y PROCESAMIENTO DE DATOS ===
 
+def obtener_ventana_competicion(liga_codigo):
+    """
+    Descarga una sola vez la ventana de partidos de una competición
+    (VENTANA_PASADO_DIAS hacia atrás y VENTANA_FUTURO_DIAS hacia adelante)
+    y la guarda indexada. Próximos, recientes y vistas por equipo salen de aquí.
+    """
+    cache_key = f"ventana_{liga_codigo}"
+    ventana = obtener_cache(cache_key)
+    if ventana:
+        return ventana
+    # Si otro handler ya está pidiendo lo mismo, esperar su resultado
+    return vuelos_datos.ejecutar(cache_key, _descargar_ventana, liga_codigo, cache_key)
+
+def _descargar_ventana(liga_codigo, cache_key):
+    ventana = obtener_cache(cache_key)
+    if ventana:
+        return ventana
+    fecha_inicio = (datetime.now() - timedelta(days=VENTANA_PASADO_DIAS)).strftime("%Y-%m-%d")
+    fecha_fin = (datetime.now() + timedelta(days=VENTANA_FUTURO_DIAS)).strftime("%Y-%m-%d")
+    if FOOTBALL_API_KEY:
+        try:
+            with medir("api"):
+                status, data = football_api.obtener_json(
+                    f"competitions/{liga_codigo}/matches",
+                    params={"dateFrom": fecha_inicio, "dateTo": fecha_fin},
+                    ttl=CACHE_DURACION,
+                    timeout=15
+                )
+            if status == 200:
+                ventana = indexar_partidos(data.get("matches", []), liga_codigo)
+                guardar_cache(cache_key, ventana)
+                return ventana
+            print(f"⚠️ football-data respondió {status} para {liga_codigo}")
+        except Exception as e:
+            print(f"❌ Error obteniendo partidos: {e}")
+    return _ventana_historico(liga_codigo, cache_key, fecha_inicio, fecha_fin)
+
+def _ventana_historico(liga_codigo, cache_key, fecha_inicio, fecha_fin):
+    """Respaldo sin red: la misma ventana leída del histórico local (None si está vacío)"""
+    matches = historical_store.consultar_partidos(liga_codigo, fecha_inicio, fecha_fin)
+    if not matches:
+        return None
+    print(f"📦 Usando histórico local para {liga_codigo} ({len(matches)} partidos)")
+    ventana = indexar_partidos(matches, liga_codigo)
+    # Vida corta: en cuanto la API vuelva se prefieren sus datos
+    guardar_cache(cache_key, ventana, HISTORICO_RESPALDO_TTL)
+    return ventana
+
+# Palabras que no distinguen equipos ("FC", "Club", "de"...)
+PALABRAS_GENERICAS_EQUIPO = {"fc", "cf", "sc", "ac", "ss", "afc", "club", "de", "the"}
+
+def _palabras_equipo(nombre):
+    return set(re.findall(r"\w+", normalizar(nombre))) - PALABRAS_GENERICAS_EQUIPO
+
+def _puntuacion_equipo(palabras_config, palabras_api):
+    """(solapamiento sobre el nombre más corto, Jaccard); (0, 0) si no llega al mínimo"""
+    if not palabras_config or not palabras_api:
+        return (0, 0)
+    comunes = len(palabras_config & palabras_api)
+    solapamiento = comunes / min(len(palabras_config), len(palabras_api))
+    if solapamiento < 0.6:
+        return (0, 0)
+    return (solapamiento, comunes / len(palabras_config | palabras_api))
+
+def resolver_equipo(equipo_api, liga_codigo):
+    """
+    Traduce un equipo de la API ({"id", "name"}) a su clave en equipos_ligas.
+    Primero busca una coincidencia exacta con la clave, nombre_oficial o un alias;
+    si no la hay, elige el candidato con mejor puntuación de palabras entre todos.
+    El resultado se guarda por id de la API en indice_equipos, salvo que haya un
+    empate entre equipos distintos (ambiguo): entonces no se asigna ni se guarda.
+    """
+    team_id = equipo_api.get("id")
+    if team_id in indice_equipos:
+        return indice_equipos[team_id]
+    nombre_api = equipo_api.get("name", "")
+    nombre_normalizado = " ".join(re.findall(r"\w+", normalizar(nombre_api)))
+
+    clave = None
+    exactos = [
+        equipo for equipo, datos in equipos_ligas.items()
+        if nombre_normalizado in {" ".join(re.findall(r"\w+", normalizar(n)))
+                                  for n in [equipo, datos.get("nombre_oficial", equipo)] + list(datos.get("alias", []))}
+    ]
+    if len(exactos) == 1:
+        clave = exactos[0]
+    else:
+        palabras_api = _palabras_equipo(nombre_api)
+        puntuados = sorted(
+            ((_puntuacion_equipo(_palabras_equipo(datos.get("nombre_oficial", equipo)), palabras_api),
+              datos.get("liga") == liga_codigo, equipo)
+             for equipo, datos in equipos_ligas.items()),
+            reverse=True
+        )
+        if puntuados and puntuados[0][0] > (0, 0):
+            mejor = puntuados[0]
+            # A igual puntuación desempata la liga; si tampoco, es ambiguo
+            if len(puntuados) > 1 and puntuados[1][:2] == mejor[:2]:
+                print(f"⚠️ Equipo ambiguo en la API: {nombre_api} ({mejor[2]} / {puntuados[1][2]})")
+                return None
+            clave = mejor[2]
+    if team_id is not None:
+        indice_equipos[team_id] = clave
+    return clave
+
+def indexar_partidos(matches, liga_codigo=""):
+    """Ordena la ventana y la separa en próximos, recientes y partidos por equipo"""
+    ordenados = sorted(matches, key=lambda m: m.get("utcDate", ""))
+    proximos = [m for m in limpiar_datos_antiguos(ordenados) if m.get("status") in ESTADOS_PROGRAMADOS]
+    recientes = [m for m in ordenados if m.get("status") == "FINISHED"]
+    # clave de equipos_ligas -> posiciones de sus partidos / ids de la API
+    por_equipo = {}
+    ids_equipo = {}
+    for tipo, lista in (("proximos", proximos), ("recientes", recientes)):
+        for posicion, match in enumerate(lista):
+            for lado in ("homeTeam", "awayTeam"):
+                equipo_api = match.get(lado) or {}
+                clave = resolver_equipo(equipo_api, liga_codigo)
+                if clave is None:
+                    continue
+                por_equipo.setdefault(clave, {"proximos": [], "recientes": []})[tipo].append(posicion)
+                if equipo_api.get("id") not in ids_equipo.setdefault(clave, []):
+                    ids_equipo[clave].append(equipo_api.get("id"))
+    return {
+        "actualizado": time.time(),
+        "proximos": proximos,
+        "recientes": recientes,
+        "por_equipo": por_equipo,
+        "ids_equipo": ids_equipo,
+    }
+
 def obtener_proximos_partidos(liga_codigo, limite=5):
-    """Obtiene próximos partidos de una liga específica, con cache y validación de fechas"""
-    cache_key = f"proximos_{liga_codigo}_{limite}"
-    datos_cache = obtener_cache(cache_key)
-    if datos_cache:
-        datos_validos = limpiar_datos_antiguos(datos_cache)
-        if datos_validos:
-            return datos_validos
-    if not FOOTBALL_API_KEY:
-        return []
-    try:
-        fecha_hoy = datetime.now().strftime("%Y-%m-%d")
-        fecha_limite = (datetime.now() + timedelta(days=60)).strftime("%Y-%m-%d")
-        url = f"{FOOTBALL_API_URL}competitions/{liga_codigo}/matches?dateFrom={fecha_hoy}&dateTo={fecha_limite}&status=SCHEDULED"
-        response = requests.get(url, headers=headers, timeout=15)
-        if response.status_code == 200:
-            matches = response.json().get("matches", [])
-            matches_validos = limpiar_datos_antiguos(matches)
-            matches_finales = matches_validos[:limite]
-            if matches_finales:
-                guardar_cache(cache_key, matches_finales)
-            return matches_finales
-        else:
-            return []
-    except Exception as e:
-        print(f"❌ Error obteniendo partidos: {e}")
-        return []
+    """Próximos partidos de una liga (desde la ventana de la competición)"""
+    ventana = obtener_ventana_competicion(liga_codigo)
+    return ventana["proximos"][:limite] if ventana else []
 
 def obtener_partidos_recientes(liga_codigo, limite=5):
-    """Obtiene partidos recientes de una liga con cache y validación"""
-    cache_key = f"recientes_{liga_codigo}_{limite}"
-    datos_cache = obtener_cache(cache_key)
-    if datos_cache:
-        return datos_cache
-    if not FOOTBALL_API_KEY:
-        return []
-    try:
-        fecha_fin = datetime.now().strftime("%Y-%m-%d")
-        fecha_inicio = (datetime.now() - timedelta(days=60)).strftime("%Y-%m-%d")
-        url = f"{FOOTBALL_API_URL}competitions/{liga_codigo}/matches?dateFrom={fecha_inicio}&dateTo={fecha_fin}&status=FINISHED"
-        response = requests.get(url, headers=headers, timeout=15)
-        if response.status_code == 200:
-            matches = response.json().get("matches", [])
-            matches_recientes = matches[-limite:] if matches else []
-            if matches_recientes:
-                guardar_cache(cache_key, matches_recientes)
-            return matches_recientes
-        else:
-            return []
-    except Exception as e:
-        print(f"❌ Error obteniendo partidos recientes: {e}")
+    """Últimos partidos jugados de una liga (desde la ventana de la competición); limite=None: todos"""
+    ventana = obtener_ventana_competicion(liga_codigo)
+    if not ventana:
         return []
+    return ventana["recientes"][-limite:] if limite else list(ventana["recientes"])
 
 def buscar_equipo_especifico_mejorado(equipo_info, limite_partidos=8):
     """Versión mejorada de búsqueda de equipo específico"""
@@ -210,33 +379,22 @@ def buscar_equipo_especifico_mejorado(equipo_info, limite_partidos=8):
         return None
     liga_codigo = equipo_info["liga"]
     nombre_oficial = equipo_info["nombre_oficial"]
-    cache_key = f"equipo_{equipo_info['equipo']}_{liga_codigo}"
-    datos_cache = obtener_cache(cache_key)
-    if datos_cache:
-        return datos_cache
-    proximos = obtener_proximos_partidos(liga_codigo, 15)
-    recientes = obtener_partidos_recientes(liga_codigo, 15)
     equipo_data = {
         "nombre": nombre_oficial,
         "liga": liga_codigo,
+        "ids": [],
         "proximos": [],
         "recientes": []
     }
-    for match in proximos:
-        home_team = match.get("homeTeam", {}).get("name", "")
-        away_team = match.get("awayTeam", {}).get("name", "")
-        if es_mismo_equipo(nombre_oficial, home_team) or es_mismo_equipo(nombre_oficial, away_team):
-            equipo_data["proximos"].append(match)
-            if len(equipo_data["proximos"]) >= limite_partidos:
-                break
-    for match in recientes:
-        home_team = match.get("homeTeam", {}).get("name", "")
-        away_team = match.get("awayTeam", {}).get("name", "")
-        if es_mismo_equipo(nombre_oficial, home_team) or es_mismo_equipo(nombre_oficial, away_team):
-            equipo_data["recientes"].append(match)
-            if len(equipo_data["recientes"]) >= limite_partidos:
-                break
-    guardar_cache(cache_key, equipo_data)
+    ventana = obtener_ventana_competicion(liga_codigo)
+    if not ventana:
+        return equipo_data
+    # Los partidos ya vienen indexados por equipo desde la ingesta
+    clave = equipo_info["equipo"]
+    posiciones = ventana["por_equipo"].get(clave, {"proximos": [], "recientes": []})
+    equipo_data["ids"] = ventana["ids_equipo"].get(clave, [])
+    equipo_data["proximos"] = [ventana["proximos"][i] for i in posiciones["proximos"]][:limite_partidos]
+    equipo_data["recientes"] = [ventana["recientes"][i] for i in posiciones["recientes"]][-limite_partidos:]
     return equipo_data
 
 def validar_fecha_partido(fecha_utc):
@@ -261,23 +419,6 @@ def limpiar_datos_antiguos(partidos):
             partidos_validos.append(partido)
     return partidos_validos
 
-def es_mismo_equipo(nombre_oficial, nombre_api):
-    """Determina si dos nombres se refieren al mismo equipo"""
-    nombre_oficial_lower = nombre_oficial.lower()
-    nombre_api_lower = nombre_api.lower()
-    if nombre_oficial_lower == nombre_api_lower:
-        return True
-    palabras_oficial = set(nombre_oficial_lower.split())
-    palabras_api = set(nombre_api_lower.split())
-    palabras_comunes = {"fc", "cf", "sc", "ac", "ss", "club", "de", "united", "city"}
-    palabras_oficial -= palabras_comunes
-    palabras_api -= palabras_comunes
-    if not palabras_oficial or not palabras_api:
-        return False
-    coincidencias = len(palabras_oficial.intersection(palabras_api))
-    total_palabras = min(len(palabras_oficial), len(palabras_api))
-    return coincidencias / total_palabras >= 0.6
-
 def generar_respuesta_inteligente(equipo_info, datos_equipo, pregunta_original):
     """Genera respuestas más específicas y útiles"""
     if not datos_equipo:
@@ -297,7 +438,7 @@ def generar_respuesta_inteligente(equipo_info, datos_equipo, pregunta_original):
                     fecha_formateada = "Fecha por confirmar"
                 home = match["homeTeam"]["name"]
                 away = match["awayTeam"]["name"]
-                es_local = es_mismo_equipo(equipo_info["nombre_oficial"], home)
+                es_local = match["homeTeam"].get("id") in datos_equipo["ids"]
                 rival = away if es_local else home
                 ubicacion = "🏠" if es_local else "✈️"
                 respuesta += f"{i+1}. {fecha_formateada} {ubicacion}\n"
@@ -325,7 +466,7 @@ def generar_respuesta_inteligente(equipo_info, datos_equipo, pregunta_original):
                 score_away = match.get("score", {}).get("fullTime", {}).get("away", 0)
                 if score_home is None or score_away is None:
                     continue
-                es_local = es_mismo_equipo(equipo_info["nombre_oficial"], home)
+                es_local = match["homeTeam"].get("id") in datos_equipo["ids"]
                 goles_equipo = score_home if es_local else score_away
                 goles_rival = score_away if es_local else score_home
                 rival = away if es_local else home
@@ -401,6 +542,40 @@ def formatear_partidos(partidos, tipo="próximos"):
 
 # === MANEJO DE MENSAJES Y COMANDOS (YA USANDO CONFIG JSON) ===
 
+# === ORDEN POR CHAT ===
+
+# chat_id -> [lock, updates usando el lock]; la entrada se borra cuando nadie la usa
+_locks_chat = {}
+# Límite global de handlers ejecutándose; se toma después del lock del chat
+_semaforo_handlers = asyncio.Semaphore(TELEGRAM_CONCURRENCIA)
+
+def en_orden_por_chat(handler):
+    """
+    Con concurrent_updates, PTB atiende varios updates a la vez. Este decorador
+    serializa los de un mismo chat (asyncio.Lock es FIFO, y las tareas llegan al
+    lock en el orden en que PTB las crea), mientras chats distintos avanzan en paralelo.
+    El límite global (TELEGRAM_CONCURRENCIA) se aplica aquí, ya con el lock del chat:
+    si lo aplicara PTB, los updates de un chat esperando su turno ocuparían huecos
+    y un solo chat insistente bloquearía a todos los demás.
+    Se aplica al registrar los handlers, no en su definición, porque unos llaman a otros.
+    """
+    @functools.wraps(handler)
+    async def envoltura(update, context):
+        chat = update.effective_chat
+        if chat is None:
+            async with _semaforo_handlers:
+                return await handler(update, context)
+        entrada = _locks_chat.setdefault(chat.id, [asyncio.Lock(), 0])
+        entrada[1] += 1
+        try:
+            async with entrada[0], _semaforo_handlers:
+                return await handler(update, context)
+        finally:
+            entrada[1] -= 1
+            if entrada[1] == 0:
+                _locks_chat.pop(chat.id, None)
+    return envoltura
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(f"🚀 Comando /start recibido de {update.effective_user.full_name}")
     reply_markup = ReplyKeyboardMarkup(teclado_principal, resize_keyboard=True)
@@ -429,13 +604,36 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cache_count = len(cache_datos)
+    stats_cache = cache_datos.estadisticas()
     mensaje_stats = ayuda_mensaje["stats"].format(
         cache_count=cache_count,
         equipos=len(equipos_ligas),
         ligas=len(leagues),
         api="✅ Conectada" if FOOTBALL_API_KEY else "❌ Desconectada",
-        ia="✅ Activa" if "ask_llm" in globals() else "❌ Inactiva"
+        ia="✅ Activa" if "ask_llm_async" in globals() else "❌ Inactiva"
     )
+    mensaje_stats += (
+        f"\n💾 Cache: {stats_cache['hit_rate']}% aciertos "
+        f"({stats_cache['hits']} hits / {stats_cache['misses']} misses, "
+        f"{stats_cache['desalojos']} desalojos, {round(stats_cache['bytes'] / 1024, 1)} KB)"
+    )
+    api = football_api.obtener_contadores()
+    mensaje_stats += (
+        f"\n🌐 Llamadas API hoy: {api['llamadas_hoy']} "
+        f"(429: {api['respuestas_429']}, esperas por cuota: {api['esperas']})"
+    )
+    planificador = planificador_llm.estadisticas()
+    mensaje_stats += (
+        f"\n🚦 IA: {planificador['activas']}/{planificador['max_concurrencia']} generando, "
+        f"{planificador['en_cola']} en cola (rechazadas: {planificador['rechazadas']})"
+    )
+    cola = estado_cola()
+    if cola:
+        mensaje_stats += (
+            f"\n📝 Logs en cola: {cola['en_cola']} "
+            f"(último lote {cola['ultimo_lote']} en {cola['ultima_latencia_ms']} ms, "
+            f"promedio {cola['promedio_latencia_ms']} ms)"
+        )
     await update.message.reply_text(mensaje_stats, parse_mode="Markdown")
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -450,9 +648,134 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif query.data == "help_about":
         await query.edit_message_text(ayuda_mensaje["about"], parse_mode="Markdown")
 
+# === RECOLECCIÓN CONCURRENTE DE DATOS ===
+
+# Pool propio (y no el executor por defecto de asyncio) para las consultas de datos
+ejecutor_datos = ThreadPoolExecutor(max_workers=FETCH_MAX_HILOS, thread_name_prefix="datos")
+
+async def reunir_datos(consultas, timeout=FETCH_TIMEOUT):
+    """
+    Ejecuta en paralelo (cada una en un hilo de ejecutor_datos) funciones de datos bloqueantes.
+    consultas: dict nombre -> (funcion, *args). Cada una tiene su propio timeout;
+    si falla o se pasa de tiempo su resultado es None y las demás siguen,
+    así la espera total es la de la más lenta y no la suma.
+    Tras un timeout el hilo no se puede interrumpir y sigue hasta que la petición
+    HTTP termine (su propio timeout); como el pool tiene FETCH_MAX_HILOS hilos,
+    las consultas colgadas no se acumulan: las nuevas esperan turno.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def _ejecutar(nombre, funcion, *args):
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(ejecutor_datos, functools.partial(funcion, *args)), timeout
+            )
+        except asyncio.TimeoutError:
+            print(f"⏱️ Timeout obteniendo {nombre} ({timeout}s), se continúa con datos parciales")
+        except Exception as e:
+            print(f"❌ Error obteniendo {nombre}: {e}")
+        return None
+
+    nombres = list(consultas)
+    resultados = await asyncio.gather(*[_ejecutar(nombre, *consultas[nombre]) for nombre in nombres])
+    return dict(zip(nombres, resultados))
+
+# === STREAMING DE RESPUESTAS ===
+
+async def responder_en_streaming(mensaje_progreso, prompt, encabezado=""):
+    """
+    Consulta el LLM y va mostrando el texto en mensaje_progreso a medida que se genera.
+    Las ediciones intermedias van sin Markdown (el texto parcial puede no ser válido)
+    y se espacian EDICION_INTERVALO segundos. Devuelve (texto, completa): completa es
+    False si hubo un error del LLM, aunque sea a mitad de respuesta. La edición final
+    con formato la hace quien llama.
+    Si ya hay una generación en curso con el mismo prompt, se espera su resultado;
+    si no, la generación espera turno en planificador_llm (justo entre chats).
+    """
+    async def avisar_posicion(posicion):
+        try:
+            await mensaje_progreso.edit_text(f"⏳ En cola: #{posicion}. El servidor de IA está ocupado...")
+        except (BadRequest, RetryAfter):
+            pass
+
+    return await vuelos_llm.ejecutar(
+        prompt, lambda: planificador_llm.ejecutar(
+            mensaje_progreso.chat_id,
+            lambda: _generar_en_streaming(mensaje_progreso, prompt, encabezado),
+            avisar_posicion
+        )
+    )
+
+async def consultar_llm(mensaje_progreso, tipo, parametros, datos=None, encabezado="", ttl=None):
+    """
+    Genera la respuesta de una plantilla de prompt pasando por cache_llm.
+    parametros: valores que forman la pregunta (se normalizan para la clave).
+    datos: contexto con datos reales (entra en la clave solo como huella).
+    ttl: vida de la respuesta; para datos de una liga, lo que les queda de frescura.
+    """
+    clave = clave_respuesta_llm(tipo, parametros, datos)
+    with medir("cache"):
+        respuesta = cache_llm.obtener(clave)
+    if respuesta:
+        print(f"⚡ Respuesta LLM desde cache ({tipo})")
+        return respuesta
+    prompt = crear_prompt(tipo, **parametros, **(datos or {}))
+    try:
+        respuesta, completa = await responder_en_streaming(mensaje_progreso, prompt, encabezado)
+    except ColaLlenaError as e:
+        print(f"🚦 {e}")
+        return "⚠️ El servidor de IA está saturado en este momento. Inténtalo de nuevo en un minuto."
+    vida = CACHE_DURACION if ttl is None else ttl
+    # No guardar respuestas con errores (también los cortes a mitad de stream)
+    # ni respuestas sobre datos a punto de caducar
+    if respuesta and completa and vida > 0:
+        cache_llm.guardar(clave, respuesta, ttl=vida)
+    return respuesta
+
+async def _generar_en_streaming(mensaje_progreso, prompt, encabezado):
+    # "llm" cuenta desde que se obtiene hueco en el planificador (sin la espera en cola)
+    with medir("llm"):
+        return await _generar_texto(mensaje_progreso, prompt, encabezado)
+
+async def _generar_texto(mensaje_progreso, prompt, encabezado):
+    if not LLM_STREAMING:
+        texto = await ask_llm_async(prompt)
+        return texto, not texto.startswith("⚠️")
+
+    texto = ""
+    completa = True
+    texto_mostrado = ""
+    proxima_edicion = time.monotonic() + EDICION_INTERVALO / 2
+    async for fragmento in stream_llm_async(prompt):
+        texto += fragmento
+        if isinstance(fragmento, FragmentoError):
+            completa = False
+        if time.monotonic() < proxima_edicion or not texto.strip():
+            continue
+        vista = (encabezado + texto)[:LIMITE_MENSAJE_TELEGRAM - 2] + " ▌"
+        if vista == texto_mostrado:
+            continue
+        try:
+            with medir("telegram_edit"):
+                await mensaje_progreso.edit_text(vista)
+            texto_mostrado = vista
+            proxima_edicion = time.monotonic() + EDICION_INTERVALO
+        except RetryAfter as e:
+            # Telegram pide esperar: posponer la próxima edición
+            proxima_edicion = time.monotonic() + float(e.retry_after)
+        except BadRequest as e:
+            print(f"⚠️ Edición parcial rechazada: {e}")
+            proxima_edicion = time.monotonic() + EDICION_INTERVALO
+    return texto, completa
+
 # === MANEJADOR DE MENSAJES PRINCIPAL ===
 
 async def handle_message(update: Update, context: CallbackContext):
+    # "total": desde que el handler recibe el mensaje hasta la respuesta final
+    with medir("total"):
+        await _atender_mensaje(update, context)
+
+async def _atender_mensaje(update, context):
     user_input = update.message.text.strip()
     chat_id = update.effective_chat.id
     user_name = update.effective_user.full_name
@@ -467,121 +790,253 @@ async def handle_message(update: Update, context: CallbackContext):
         await help_command(update, context)
         return
 
+    # Una sola pasada del matcher: respuesta personalizada, equipo, liga e intención
+    with medir("matcher"):
+        deteccion = matcher.analizar(user_input)
+
     # Respuestas personalizadas
-    respuesta_personalizada = buscar_respuesta_personalizada(user_input)
+    respuesta_personalizada = deteccion["respuesta_personalizada"]
     if respuesta_personalizada:
         await update.message.reply_text(respuesta_personalizada, parse_mode="Markdown")
         try:
-            registrar_interaccion(user_name, user_input, respuesta_personalizada, liga="personalizada")
+            with medir("logging"):
+                encolar_interaccion(user_name, user_input, respuesta_personalizada, liga="personalizada")
         except Exception as e:
             print(f"❌ Error logging respuesta personalizada: {e}")
         return
 
-      # === NUEVO BLOQUE: Análisis de Ligas CORREGIDO ===
-    liga_codigo, liga_nombre = detectar_equipo_y_liga(user_input)
-    if liga_codigo:
+    # === Análisis de Ligas (botones del teclado o nombre de la liga sin equipo) ===
+    if deteccion["liga"] and not deteccion["equipo"]["detectado"]:
+        liga_codigo, liga_nombre = deteccion["liga"]["codigo"], deteccion["liga"]["nombre"]
         mensaje_progreso = await update.message.reply_text(f"🔍 Analizando {liga_nombre}...")
         try:
-            partidos_proximos = obtener_proximos_partidos(liga_codigo, 5)
-            partidos_recientes = obtener_partidos_recientes(liga_codigo, 5)
+            # Próximos y recientes salen de la misma ventana de la competición (una
+            # sola descarga), así que aquí no hay nada que paralelizar: solo el timeout
+            datos_liga = await reunir_datos({"ventana": (obtener_ventana_competicion, liga_codigo)})
+            ventana = datos_liga["ventana"]
+            partidos_proximos = ventana["proximos"][:5] if ventana else []
+            partidos_recientes = list(ventana["recientes"]) if ventana else []
             contexto_datos = ""
-            contexto_datos += formatear_partidos(partidos_recientes, tipo="recientes") + "\n"
-            contexto_datos += formatear_partidos(partidos_proximos, tipo="próximos")
-            prompt_liga = crear_prompt(
-                "liga",
-                liga_nombre=liga_nombre,
-                fecha_actual=datetime.now().strftime("%d/%m/%Y"),
-                contexto_datos=contexto_datos
+            if not ventana:
+                contexto_datos += "(Datos parciales: no se pudieron obtener los partidos de la liga)\n"
+            # Agregados por equipo de toda la ventana, con presupuesto de tokens
+            contexto_datos += construir_contexto(
+                filas_desde_api(partidos_recientes),
+                proximos=filas_desde_api(partidos_proximos),
+                ultimos_partidos=5
+            )
+            encabezado = f"🏆 Análisis de {liga_nombre}:\n\n"
+            respuesta_ia = await consultar_llm(
+                mensaje_progreso, "liga",
+                {"liga_nombre": liga_nombre, "fecha_actual": datetime.now().strftime("%d/%m/%Y")},
+                datos={"contexto_datos": contexto_datos},
+                encabezado=encabezado,
+                ttl=frescura_ventana(liga_codigo)
             )
-            respuesta_ia = ask_llm(prompt_liga)
-            await mensaje_progreso.edit_text(f"🏆 **Análisis de {liga_nombre}:**\n\n{respuesta_ia}", parse_mode="Markdown")
+            with medir("telegram_edit"):
+                await mensaje_progreso.edit_text(f"🏆 **Análisis de {liga_nombre}:**\n\n{respuesta_ia}", parse_mode="Markdown")
             try:
-                registrar_interaccion(user_name, user_input, respuesta_ia, liga=liga_codigo)
+                with medir("logging"):
+                    encolar_interaccion(user_name, user_input, respuesta_ia, liga=liga_codigo)
             except Exception as e:
                 print(f"❌ Error logging liga: {e}")
         except Exception as e:
-            await mensaje_progreso.edit_text(
-                f"⚠️ No se puede conectar al servidor LLM. ¿Está LM Studio ejecutándose?\n\n{e}"
-            )
+            with medir("telegram_edit"):
+                await mensaje_progreso.edit_text(
+                    f"⚠️ No se puede conectar al servidor LLM. ¿Está LM Studio ejecutándose?\n\n{e}"
+                )
         return
 
 
     # --- Equipos específicos, igual que antes ---
     mensaje_progreso = await update.message.reply_text("🧐 Analizando tu consulta...")
     try:
-        equipo_info = detectar_equipo_y_liga(user_input)
+        equipo_info = deteccion["equipo"]
         if equipo_info["detectado"]:
-            datos_equipo = buscar_equipo_especifico_mejorado(equipo_info)
+            # Todos los equipos mencionados (p. ej. "Bayern vs Dortmund") se buscan a la vez
+            equipos = deteccion["equipos"][:MAX_EQUIPOS_CONSULTA]
+            datos_equipos = await reunir_datos({
+                info["equipo"]: (buscar_equipo_especifico_mejorado, info) for info in equipos
+            })
+            datos_equipo = datos_equipos[equipo_info["equipo"]]
             if datos_equipo and (datos_equipo["proximos"] or datos_equipo["recientes"]):
                 respuesta = generar_respuesta_inteligente(equipo_info, datos_equipo, user_input)
+                for info in equipos[1:]:
+                    datos_rival = datos_equipos[info["equipo"]]
+                    if datos_rival and (datos_rival["proximos"] or datos_rival["recientes"]):
+                        respuesta += "\n\n" + generar_respuesta_inteligente(info, datos_rival, user_input)
                 # Preguntas de predicción
-                if any(p in user_input.lower() for p in ["prediccion", "analisis", "opinion", "quien", "ganara", "probabilidad"]):
-                    prompt_prediccion = crear_prompt("equipo_prediccion",
-                        equipo_nombre=equipo_info['nombre_oficial'],
-                        user_input=user_input,
-                        contexto_equipo=respuesta
+                if deteccion["intencion"]:
+                    prediccion_ia = await consultar_llm(
+                        mensaje_progreso, "equipo",
+                        {"equipo_nombre": equipo_info['nombre_oficial'], "user_input": user_input,
+                         "enfoque": ENFOQUE_PREDICCION},
+                        datos={"contexto_equipo": respuesta},
+                        encabezado=f"{respuesta}\n\n🧠 Análisis IA:\n",
+                        ttl=frescura_ventana(equipo_info["liga"])
                     )
-                    prediccion_ia = ask_llm(prompt_prediccion)
                     respuesta += f"\n\n🧠 **Análisis IA:**\n{prediccion_ia}"
-                await mensaje_progreso.edit_text(respuesta, parse_mode="Markdown")
+                with medir("telegram_edit"):
+                    await mensaje_progreso.edit_text(respuesta, parse_mode="Markdown")
                 try:
-                    registrar_interaccion(user_name, user_input, respuesta, liga=equipo_info["liga"])
+                    with medir("logging"):
+                        encolar_interaccion(user_name, user_input, respuesta, liga=equipo_info["liga"])
                 except Exception as e:
                     print(f"❌ Error logging equipo: {e}")
             else:
                 contexto_general = f"El usuario pregunta sobre {equipo_info['nombre_oficial']} de {league_context.get(equipo_info['liga'], 'una liga europea')}."
-                prompt_general = crear_prompt("general", user_input=user_input, contexto=contexto_general)
-                respuesta = ask_llm(prompt_general)
-                await mensaje_progreso.edit_text(f"⚽ {respuesta}\n\n💡 *Para datos más específicos, intenta más tarde cuando la API esté disponible.*", parse_mode="Markdown")
+                respuesta = await consultar_llm(
+                    mensaje_progreso, "general", {"user_input": user_input},
+                    datos={"contexto": contexto_general}, encabezado="⚽ "
+                )
+                with medir("telegram_edit"):
+                    await mensaje_progreso.edit_text(f"⚽ {respuesta}\n\n💡 *Para datos más específicos, intenta más tarde cuando la API esté disponible.*", parse_mode="Markdown")
                 try:
-                    registrar_interaccion(user_name, user_input, respuesta, liga=equipo_info["liga"])
+                    with medir("logging"):
+                        encolar_interaccion(user_name, user_input, respuesta, liga=equipo_info["liga"])
                 except Exception as e:
                     print(f"❌ Error logging general equipo: {e}")
         else:
-            prompt_mejorado = crear_prompt("general", user_input=user_input)
-            respuesta = ask_llm(prompt_mejorado)
-            await mensaje_progreso.edit_text(f"🧠 **Respuesta:**\n\n{respuesta}", parse_mode="Markdown")
+            respuesta = await consultar_llm(
+                mensaje_progreso, "general", {"user_input": user_input}, encabezado="🧠 Respuesta:\n\n"
+            )
+            with medir("telegram_edit"):
+                await mensaje_progreso.edit_text(f"🧠 **Respuesta:**\n\n{respuesta}", parse_mode="Markdown")
             try:
-                registrar_interaccion(user_name, user_input, respuesta, liga="general")
+                with medir("logging"):
+                    encolar_interaccion(user_name, user_input, respuesta, liga="general")
             except Exception as e:
                 print(f"❌ Error logging general: {e}")
     except Exception as e:
         print(f"❌ Error procesando consulta: {e}")
-        await mensaje_progreso.edit_text(
-            "⚠️ Error procesando tu consulta. Por favor, inténtalo de nuevo.\n\n"
-            "💡 **Tip:** Prueba con consultas como:\n"
-            "• *'Real Madrid próximos partidos'*\n"
-            "• *'Análisis de La Liga'*\n"
-            "• *'¿Quién ganará el siguiente Clásico?'*"
-        )
+        with medir("telegram_edit"):
+            await mensaje_progreso.edit_text(
+                "⚠️ Error procesando tu consulta. Por favor, inténtalo de nuevo.\n\n"
+                "💡 **Tip:** Prueba con consultas como:\n"
+                "• *'Real Madrid próximos partidos'*\n"
+                "• *'Análisis de La Liga'*\n"
+                "• *'¿Quién ganará el siguiente Clásico?'*"
+            )
         try:
-            registrar_interaccion(user_name, user_input, "Error procesando consulta", liga="error")
+            with medir("logging"):
+                encolar_interaccion(user_name, user_input, "Error procesando consulta", liga="error")
         except Exception as log_error:
             print(f"❌ Error logging error: {log_error}")
 #main
 
+# === MÉTRICAS PARA EL DASHBOARD ===
+
+def publicar_metricas():
+    """Escribe logs/performance.json con las métricas actuales del bot"""
+    cache_datos.purgar_expiradas()
+    cache_llm.purgar_expiradas()
+    persistent_cache.purgar_expiradas()
+    stats_cache = cache_datos.estadisticas()
+    api = football_api.obtener_contadores()
+    etapas = metrics_service.resumen()
+    total = etapas.get("total", {})
+    try:
+        guardar_json_atomico(RUTA_PERFORMANCE, {
+            "actualizado": datetime.now().isoformat(timespec="seconds"),
+            "tiempo_promedio_respuesta": round(total.get("promedio_ms", 0) / 1000, 2),
+            "tiempo_p95_respuesta": round(total.get("p95_ms", 0) / 1000, 2),
+            "cache_hit_rate": stats_cache["hit_rate"],
+            "llamadas_api_hoy": api["llamadas_hoy"],
+            "etapas": etapas,
+            "cache": stats_cache,
+            "cache_persistente": persistent_cache.estadisticas(),
+            "cache_llm": cache_llm.estadisticas(),
+            "planificador_llm": planificador_llm.estadisticas(),
+            "solicitudes_coalescidas": {
+                "datos": vuelos_datos.coalescidas,
+                "llm": vuelos_llm.coalescidas,
+            },
+        })
+    except Exception as e:
+        print(f"❌ Error guardando métricas: {e}")
+
+async def bucle_metricas():
+    """Publica las métricas cada METRICAS_INTERVALO segundos"""
+    while True:
+        await asyncio.sleep(METRICAS_INTERVALO)
+        publicar_metricas()
+
+tareas_fondo = []
+
+async def al_iniciar(application):
+    """Arranca las tareas de fondo del bot (métricas y estado del sistema)"""
+    tareas_fondo.append(asyncio.create_task(bucle_metricas()))
+    # Sondeo de API, LLM, CPU y memoria -> logs/system_status.json
+    tareas_fondo.append(asyncio.create_task(
+        health_service.bucle_salud(lambda: len(cache_datos) + len(cache_llm))
+    ))
+
+async def al_apagar(application):
+    """Detiene tareas de fondo, vacía la cola de logs y cierra el cliente HTTP del LLM"""
+    for tarea in tareas_fondo:
+        tarea.cancel()
+    publicar_metricas()
+    detener_escritor()
+    ejecutor_datos.shutdown(wait=False, cancel_futures=True)
+    if "cerrar_cliente_async" in globals():
+        await cerrar_cliente_async()
+
+def iniciar_webhook(app):
+    """
+    Sirve los updates por webhook en WEBHOOK_LISTEN:WEBHOOK_PORT/WEBHOOK_PATH.
+    PTB registra WEBHOOK_URL/WEBHOOK_PATH en Telegram (set_webhook) al arrancar y
+    rechaza con 403 las peticiones sin la cabecera X-Telegram-Bot-Api-Secret-Token
+    correcta. Al recibir SIGINT/SIGTERM deja de aceptar peticiones, termina los
+    updates en curso y luego ejecuta al_apagar.
+    """
+    if not WEBHOOK_URL:
+        print("❌ FATAL: BOT_MODO=webhook requiere WEBHOOK_URL (URL pública del bot)")
+        return
+    if not WEBHOOK_SECRET:
+        print("⚠️ WEBHOOK_SECRET vacío: el webhook aceptará peticiones de cualquiera")
+    print(f"🌐 Webhook escuchando en {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+    app.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=WEBHOOK_PATH,
+        webhook_url=f"{WEBHOOK_URL}/{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET or None,
+    )
+
 def main():
     print("🚀 Iniciando Bot de Fútbol v2.0...")
     print(f"🎯 Respuestas personalizadas: {len(respuestas_personalizadas)}")
     print(f"⚽ Equipos monitoreados: {len(equipos_ligas)}")
     print(f"🏆 Ligas disponibles: {len(leagues)}")
     print(f"📊 API de fútbol: {'✅ Configurada' if FOOTBALL_API_KEY else '❌ No configurada'}")
-    print(f"🤖 IA: {'✅ Disponible' if 'ask_llm' in globals() else '❌ No disponible'}")
+    print(f"🤖 IA: {'✅ Disponible' if 'ask_llm_async' in globals() else '❌ No disponible'}")
 
     if not TELEGRAM_TOKEN:
         print("❌ FATAL: No se encontró TELEGRAM_BOT_TOKEN")
         return
 
     try:
-        app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
-        app.add_handler(CommandHandler("start", start))
-        app.add_handler(CommandHandler("help", help_command))
-        app.add_handler(CommandHandler("equipos", equipos_command))
-        app.add_handler(CommandHandler("stats", stats_command))
-        app.add_handler(CallbackQueryHandler(button_handler))
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+        app = (
+            ApplicationBuilder()
+            .token(TELEGRAM_TOKEN)
+            .post_init(al_iniciar)
+            .post_shutdown(al_apagar)
+            # PTB casi sin límite; en_orden_por_chat ordena cada chat y limita
+            # a TELEGRAM_CONCURRENCIA los handlers que corren a la vez
+            .concurrent_updates(TELEGRAM_UPDATES_EN_VUELO)
+            .build()
+        )
+        app.add_handler(CommandHandler("start", en_orden_por_chat(start)))
+        app.add_handler(CommandHandler("help", en_orden_por_chat(help_command)))
+        app.add_handler(CommandHandler("equipos", en_orden_por_chat(equipos_command)))
+        app.add_handler(CommandHandler("stats", en_orden_por_chat(stats_command)))
+        app.add_handler(CallbackQueryHandler(en_orden_por_chat(button_handler)))
+        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, en_orden_por_chat(handle_message)))
         print("✅ Todos los handlers configurados\n🔥 ¡Listo para analizar fútbol!")
-        app.run_polling()
+        if BOT_MODO == "webhook":
+            iniciar_webhook(app)
+        else:
+            app.run_polling()
     except Exception as e:
         print(f"❌ Error crítico iniciando el bot: {e}")
         import traceback